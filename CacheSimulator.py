@@ -1,22 +1,36 @@
+import argparse
+import copy
+import heapq
+import json
 import math
 import random
-import sys
+import struct
+from array import array
+from collections import Counter, OrderedDict
+from itertools import islice
+
+from Prefetcher import PREFETCHERS
+from Stats import SimStats
 
 clock = 0
 
+# where the Dinero traces live; every script takes trace names relative to it
+TRACE_DIR = "./Traces/Spec_Benchmark/"
+
 class L1Cache:
     """
     L1 cache class.
     """
-    def __init__(self, l2):
+    def __init__(self, l2, block_size=64, capacity=1 << 15, access_time=5e-10,
+                 idle_consumption=0.5, active_consumption=1):
         # constants
-        self.access_time = 5e-10
-        self.idle_consumption = 0.5
-        self.active_consumption = 1
+        self.access_time = access_time
+        self.idle_consumption = idle_consumption
+        self.active_consumption = active_consumption
         self.l2 = l2
         
-        self.block_size = 64
-        self.capacity = 1 << 15
+        self.block_size = block_size
+        self.capacity = capacity
         
         # masking attributes
         sets = self.capacity // self.block_size
@@ -35,6 +49,15 @@ class L1Cache:
         self.total_active_energy = 0
         self.accesses = 0
         self.misses = 0
+        
+        # optional victim buffer, looked up on misses before L2
+        self.victim = None
+        
+        # optional 3C miss classifier
+        self.classifier = None
+        
+        # optional per-region miss attribution
+        self.profile = None
 
     def get_set(self, address):
         """
@@ -66,9 +89,11 @@ class L1Cache:
         if self.valid[set_index]:
             if tag == self.tags[set_index]:
                 # hit
+                if self.classifier is not None:
+                    self.classifier.access(address >> self.block_bits, True)
                 return True
             else:
-                # eviction
+                # eviction, hits if the victim buffer had the block
                 return self.evict(set_index, tag)
         else:
             # compulsory miss, no eviction
@@ -88,34 +113,65 @@ class L1Cache:
         if self.valid[set_index]:
             if tag == self.tags[set_index]:
                 # write through to l2
+                if self.classifier is not None:
+                    self.classifier.access(address >> self.block_bits, True)
                 self.l2.write(address)
                 return True
             else:
                 # eviction
-                self.evict(set_index, tag)
-                return False
+                victim_hit = self.evict(set_index, tag, False)
         else:
             # compulsory miss, no eviction
-            self.invalid_miss(set_index, tag)
-            return False
+            victim_hit = self.invalid_miss(set_index, tag, False)
+        
+        if victim_hit:
+            # the line came back from the victim buffer, write through to l2
+            self.l2.write(address)
+        return victim_hit
     
-    def evict(self, set_index, tag):
+    def evict(self, set_index, tag, read=True):
         """
         Evict a block from the cache. L1 logic is the same as handling
         a compulsory miss due to directly-mapped nature and 
-        write-through to L2.
+        write-through to L2. With a victim buffer attached, the evicted
+        line moves into it and the buffer is searched for the new block;
+        returns whether the buffer supplied it.
         """
-        self.misses += 1   
+        self.misses += 1
+        if self.classifier is not None:
+            self.classifier.access((tag << self.set_bits) | set_index, False)
+        if self.profile is not None:
+            self.profile.miss(((tag << self.set_bits) | set_index) << self.block_bits)
+        victim_hit = False
+        if self.victim is not None:
+            victim_hit = self.victim.swap(
+                (tag << self.set_bits) | set_index,
+                (self.tags[set_index] << self.set_bits) | set_index,
+                read
+            )
+            # inclusion: a line the buffer supplies is still held by L2
+            assert not victim_hit or self.l2.holds(((tag << self.set_bits) | set_index) << self.block_bits)
         self.tags[set_index] = tag
         self.valid[set_index] = True
+        return victim_hit
     
-    def invalid_miss(self, set_index, tag):
+    def invalid_miss(self, set_index, tag, read=True):
         """
-        Handle a compulsory miss.
+        Handle a compulsory miss. Returns whether the victim buffer
+        supplied the block.
         """
         self.misses += 1
+        if self.classifier is not None:
+            self.classifier.access((tag << self.set_bits) | set_index, False)
+        if self.profile is not None:
+            self.profile.miss(((tag << self.set_bits) | set_index) << self.block_bits)
+        victim_hit = False
+        if self.victim is not None:
+            victim_hit = self.victim.swap((tag << self.set_bits) | set_index, None, read)
+            assert not victim_hit or self.l2.holds(((tag << self.set_bits) | set_index) << self.block_bits)
         self.tags[set_index] = tag
         self.valid[set_index] = True
+        return victim_hit
 
     def invalidate(self, address):
         """
@@ -128,6 +184,19 @@ class L1Cache:
         if self.valid[set_index] and tag == self.tags[set_index]:
             self.valid[set_index] = False
             self.tags[set_index] = -1
+        
+        # inclusion covers the victim buffer too
+        if self.victim is not None:
+            self.victim.invalidate(address >> self.block_bits)
+    
+    def set_victim(self, victim):
+        self.victim = victim
+    
+    def set_classifier(self, classifier):
+        self.classifier = classifier
+    
+    def set_profile(self, profile):
+        self.profile = profile
     
     def active_energy(self):
         return self.total_active_energy
@@ -145,26 +214,240 @@ class L1Cache:
         return self.accesses - self.misses
     
     
+class VictimCache:
+    """
+    Small fully-associative victim buffer behind a direct-mapped L1. Lines
+    evicted from the L1 land here and are searched on L1 misses before the
+    request goes to L2. The L1 is write-through, so victims are never dirty.
+    """
+    def __init__(self, entries=8, access_time=5e-10, idle_consumption=0.05, active_consumption=0.25):
+        self.entries = entries
+        self.access_time = access_time
+        self.idle_consumption = idle_consumption
+        self.active_consumption = active_consumption
+        
+        # block number -> None, kept in LRU order for O(1) lookup and update
+        self.lines = OrderedDict()
+        
+        self.total_active_energy = 0
+        self.accesses = 0
+        self.reads = 0
+        self.hits = 0
+        self.read_hits = 0
+    
+    def swap(self, block, evicted, read=True):
+        """
+        Look up a block missing from the L1 and take in the line the L1 is
+        evicting for it (None if that L1 line was invalid). Returns whether
+        the block was found; a found block moves back into the L1. Like the
+        L1 itself, only reads advance the clock.
+        """
+        global clock
+        
+        self.accesses += 1
+        self.total_active_energy += self.active_consumption * self.access_time
+        if read:
+            self.reads += 1
+            clock += self.access_time
+        
+        lines = self.lines
+        hit = block in lines
+        if hit:
+            del lines[block]
+            self.hits += 1
+            if read:
+                self.read_hits += 1
+        
+        if evicted is not None:
+            if len(lines) >= self.entries:
+                lines.popitem(last=False)
+            lines[evicted] = None
+        return hit
+    
+    def invalidate(self, block):
+        """
+        Back-invalidate a block that was just evicted in L2.
+        """
+        self.lines.pop(block, None)
+    
+    def active_energy(self):
+        return self.total_active_energy
+    
+    def idle_energy(self):
+        return self.idle_consumption * clock
+    
+    def get_accesses(self):
+        return self.accesses
+    
+    def get_hits(self):
+        return self.hits
+    
+    def saved_l2_reads(self):
+        """
+        L2 reads avoided. Write hits still write through to L2.
+        """
+        return self.read_hits
+    
+    def saved_energy(self, l2):
+        """
+        Net active energy saved: avoided L2 reads minus the buffer's own
+        lookups.
+        """
+        per_read = l2.active_consumption * l2.access_time + l2.transfer_penalty
+        return self.read_hits * per_read - self.active_energy()
+    
+    def saved_time(self, l2):
+        """
+        Serial time saved: avoided L2 reads minus the buffer's lookup time.
+        """
+        return self.read_hits * l2.access_time - self.reads * self.access_time
+    
+    
+class RegionProfile:
+    """
+    Attributes one level's misses, writebacks and DRAM energy to fixed-size
+    address regions (pages by default). Only miss paths update it, so hits
+    cost nothing extra.
+    """
+    def __init__(self, granularity=1 << 12):
+        self.granularity = granularity
+        self.region_bits = granularity.bit_length() - 1
+        
+        self.misses = Counter()
+        self.writebacks = Counter()
+        self.accesses = Counter()
+        self.energies = Counter()
+    
+    def miss(self, address):
+        self.misses[address >> self.region_bits] += 1
+    
+    def writeback(self, address):
+        self.writebacks[address >> self.region_bits] += 1
+    
+    def energy(self, address, joules):
+        region = address >> self.region_bits
+        self.accesses[region] += 1
+        self.energies[region] += joules
+    
+    def region_address(self, region):
+        return region << self.region_bits
+    
+    def top_misses(self, n=10):
+        return self.misses.most_common(n)
+    
+    def top_writebacks(self, n=10):
+        return self.writebacks.most_common(n)
+    
+    def top_energy(self, n=10):
+        return self.energies.most_common(n)
+    
+    
+class MissClassifier:
+    """
+    Classifies a cache's misses as compulsory, capacity or conflict (3C).
+    A miss on a block never seen before is compulsory; otherwise it is a
+    capacity miss if a fully-associative LRU cache of the same capacity
+    would also have missed, and a conflict miss if it would have hit.
+    """
+    def __init__(self, blocks):
+        self.blocks = blocks
+        
+        self.seen = set()
+        # shadow fully-associative LRU cache, block number -> None
+        self.shadow = OrderedDict()
+        
+        self.compulsory = 0
+        self.capacity = 0
+        self.conflict = 0
+    
+    def access(self, block, hit):
+        """
+        Record a demand access to a block and classify it if it missed.
+        """
+        shadow = self.shadow
+        in_shadow = block in shadow
+        if in_shadow:
+            shadow.move_to_end(block)
+        else:
+            if len(shadow) >= self.blocks:
+                shadow.popitem(last=False)
+            shadow[block] = None
+        
+        if hit:
+            # prefetched blocks can hit without ever missing
+            self.seen.add(block)
+        elif block not in self.seen:
+            self.seen.add(block)
+            self.compulsory += 1
+        elif in_shadow:
+            self.conflict += 1
+        else:
+            self.capacity += 1
+    
+    def get_compulsory(self):
+        return self.compulsory
+    
+    def get_capacity(self):
+        return self.capacity
+    
+    def get_conflict(self):
+        return self.conflict
+    
+    
+# caches with at least this many lines default to sparse storage
+SPARSE_LINES = 1 << 16
+
+
+class LazySets(dict):
+    """
+    Sparse per-set storage. A set's row of ways is only allocated the
+    first time the set is indexed, so memory and setup time follow the
+    trace's footprint rather than the cache's capacity.
+    """
+    __slots__ = ("ways", "fill")
+    
+    def __init__(self, ways, fill):
+        super().__init__()
+        self.ways = ways
+        self.fill = fill
+    
+    def __missing__(self, set_index):
+        row = [self.fill] * self.ways
+        self[set_index] = row
+        return row
+    
     
 class L2Cache:
     """
-    L2 cache class.
+    L2 cache class. Write-back and inclusive; also used for every level
+    below L2, with `next_level` pointing at the next cache down or DRAM.
+    This is the generic set-associative shape; see DirectMappedL2Cache and
+    FullyAssociativeL2Cache for the specialized ones.
     """
-    def __init__(self, associativity, l1_data, l1_instr, dram):
-        self.access_time = 4.5e-9    # account for additive
-        self.idle_consumption = 0.8
-        self.active_consumption = 2
-        self.transfer_penalty = 5e-12
+    def __init__(self, associativity, l1_data, l1_instr, next_level, capacity=1 << 18, storage="dense",
+                 block_size=64, access_time=4.5e-9, idle_consumption=0.8, active_consumption=2,
+                 transfer_penalty=5e-12, replacement="random", name="L2"):
+        self.name = name
+        self.access_time = access_time    # account for additive
+        self.idle_consumption = idle_consumption
+        self.active_consumption = active_consumption
+        self.transfer_penalty = transfer_penalty
         
-        self.l1_data = l1_data
-        self.l1_instr = l1_instr
-        self.dram = dram
+        # caches above this one, back-invalidated to maintain inclusivity
+        self.uppers = [cache for cache in (l1_data, l1_instr) if cache is not None]
+        self.next_level = next_level
         
-        self.block_size = 64
-        self.capacity = 1 << 18
+        self.block_size = block_size
+        self.capacity = capacity
         self.associativity = associativity
         
+        if replacement not in ("random", "lru"):
+            raise ValueError("Unknown replacement policy: {}".format(replacement))
+        self.lru = replacement == "lru"
+        self.recency = {}    # set -> OrderedDict of ways from least to most recently used
+        
         sets = self.capacity // (self.block_size * self.associativity)
+        self.sets = sets
         
         self.block_bits = int(math.log2(self.block_size))
         self.set_bits = int(math.log2(sets))
@@ -172,14 +455,40 @@ class L2Cache:
         self.set_mask = sets - 1
         self.tag_offset = self.block_bits + self.set_bits
         
-        self.tags = [[-1] * self.associativity for _ in range(sets)]
-        self.valid = [[False] * self.associativity for _ in range(sets)]
-        self.dirty = [[False] * self.associativity for _ in range(sets)]
+        if storage == "auto":
+            storage = "sparse" if sets * self.associativity >= SPARSE_LINES else "dense"
+        self.sparse = storage == "sparse"
+        
+        if self.sparse:
+            # allocate sets on first touch, pack them densely once most are in use
+            self.tags = LazySets(self.associativity, -1)
+            self.valid = LazySets(self.associativity, False)
+            self.dirty = LazySets(self.associativity, False)
+            self.dense_threshold = sets // 2
+        else:
+            self.tags = [[-1] * self.associativity for _ in range(sets)]
+            self.valid = [[False] * self.associativity for _ in range(sets)]
+            self.dirty = [[False] * self.associativity for _ in range(sets)]
         
         self.total_active_energy = 0
         self.accesses = 0
         self.misses = 0
         
+        # optional 3C miss classifier
+        self.classifier = None
+        
+        # optional per-region miss and writeback attribution
+        self.profile = None
+        
+        # prefetching, off unless a prefetcher is attached
+        self.prefetcher = None
+        self.prefetched = {}    # resident prefetched block -> ready time
+        self.prefetch_active_energy = 0
+        self.prefetches = 0
+        self.useful_prefetches = 0
+        self.late_prefetches = 0
+        self.useless_prefetches = 0
+        
     def get_set(self, address):
         """
         Extract the bits of the address to determine the set index.
@@ -213,6 +522,12 @@ class L2Cache:
             if self.valid[set_index][i]:
                 if tag == self.tags[set_index][i]:
                     # read hit
+                    if self.lru:
+                        self.touch(set_index, i)
+                    if self.classifier is not None:
+                        self.classifier.access(address >> self.block_bits, True)
+                    if self.prefetcher is not None:
+                        self.train(address, True, True)
                     return True
             else:
                 # mark an invalid block to fill later
@@ -222,10 +537,13 @@ class L2Cache:
         if invalid != -1:
             # we have an invalid block
             self.invalid_miss(set_index, invalid, tag, False)
-            return False
         else:
             # eviction
-            return self.evict(address, False)
+            self.evict(address, False)
+        
+        if self.prefetcher is not None:
+            self.train(address, False, True)
+        return False
         
     def write(self, address):
         """
@@ -246,6 +564,12 @@ class L2Cache:
                 if tag == self.tags[set_index][i]:
                     # write hit
                     self.dirty[set_index][i] = True
+                    if self.lru:
+                        self.touch(set_index, i)
+                    if self.classifier is not None:
+                        self.classifier.access(address >> self.block_bits, True)
+                    if self.prefetcher is not None:
+                        self.train(address, True, False)
                     return True
             else:
                 # mark an invalid block to fill later
@@ -255,54 +579,285 @@ class L2Cache:
         if invalid != -1:
             # we have an invalid block
             self.invalid_miss(set_index, invalid, tag, True)
-            return False
         else:
             # eviction
             self.evict(address, True)
-            return False
+        
+        if self.prefetcher is not None:
+            self.train(address, False, False)
+        return False
     
     def invalid_miss(self, set_index, index, tag, write):
         """
         Handle a compulsory miss.
         """
         self.misses += 1
-        self.tags[set_index][index] = tag
-        self.valid[set_index][index] = True
-        self.dirty[set_index][index] = write
+        if self.classifier is not None:
+            self.classifier.access((tag << self.set_bits) | set_index, False)
+        if self.profile is not None:
+            self.profile.miss(((tag << self.set_bits) | set_index) << self.block_bits)
+        self.install(set_index, index, tag, write)
+        
+        # sets are only ever first touched on a miss that fills an invalid way
+        if self.sparse and len(self.tags) >= self.dense_threshold:
+            self.densify()
+    
+    def densify(self):
+        """
+        Switch sparse storage to packed per-set arrays for every set once
+        occupancy makes the dictionary more expensive than the full layout.
+        """
+        ways = self.associativity
+        tags, valid, dirty = self.tags, self.valid, self.dirty
+        
+        self.tags = [array("l", tags[i]) if i in tags else array("l", [-1]) * ways for i in range(self.sets)]
+        self.valid = [bytearray(valid[i]) if i in valid else bytearray(ways) for i in range(self.sets)]
+        self.dirty = [bytearray(dirty[i]) if i in dirty else bytearray(ways) for i in range(self.sets)]
+        self.sparse = False
+    
+    def touched_sets(self):
+        """
+        Number of sets holding allocated state.
+        """
+        return len(self.tags) if self.sparse else self.sets
     
     def evict(self, address, write):
         """
         Evict a random block from a set in the cache.
         """
         self.misses += 1
+        if self.classifier is not None:
+            self.classifier.access(address >> self.block_bits, False)
+        if self.profile is not None:
+            self.profile.miss(address)
         
         set_index = self.get_set(address)
         tag = self.get_tag(address)
         
-        # randomly select a block to evict
-        index = random.randint(0, self.associativity - 1)
+        # select a block to evict
+        index = self.victim_way(set_index)
         
-        # evict from L1 to maintain inclusivity
-        self.l1_data.invalidate(address)
-        self.l1_instr.invalidate(address)
+        # evict the victim from the levels above to maintain inclusivity; a
+        # dirty copy up there hands its data down
+        victim_address = self.block_number(set_index, index) << self.block_bits
+        if self.invalidate_uppers(victim_address):
+            self.dirty[set_index][index] = True
         
-        # write back to dram if evicted block is dirty
+        # write back to the next level if evicted block is dirty
         if self.dirty[set_index][index]:
-            self.dram.writeback()
-            
+            self.write_back(set_index, index)
+        
+        if self.prefetched:
+            self.drop_prefetched(set_index, index)
+        
+        self.install(set_index, index, tag, write)
+    
+    def victim_way(self, set_index):
+        """
+        Pick the way to evict from a full set.
+        """
+        if self.lru:
+            return next(iter(self.order(set_index)))
+        return random.randint(0, self.associativity - 1)
+    
+    def order(self, set_index):
+        """
+        Ways of a set from least to most recently used.
+        """
+        order = self.recency.get(set_index)
+        if order is None:
+            order = self.recency[set_index] = OrderedDict.fromkeys(range(self.associativity))
+        return order
+    
+    def touch(self, set_index, index):
+        """
+        Mark a way as most recently used.
+        """
+        self.order(set_index).move_to_end(index)
+    
+    def install(self, set_index, index, tag, dirty):
+        """
+        Fill a way with a block.
+        """
         self.tags[set_index][index] = tag
         self.valid[set_index][index] = True
-        self.dirty[set_index][index] = write
+        self.dirty[set_index][index] = dirty
+        if self.lru:
+            self.touch(set_index, index)
+    
+    def invalidate(self, address):
+        """
+        Back-invalidate a block from this cache that was just evicted in the
+        next level down. Returns whether the copy here was dirty.
+        """
+        set_index = self.get_set(address)
+        tag = self.get_tag(address)
+        
+        for i in range(len(self.tags[set_index])):
+            if self.valid[set_index][i] and tag == self.tags[set_index][i]:
+                dirty = self.invalidate_uppers(address) or bool(self.dirty[set_index][i])
+                if self.prefetched:
+                    self.drop_prefetched(set_index, i)
+                self.clear(set_index, i)
+                return dirty
+        return False
+    
+    def invalidate_uppers(self, address):
+        """
+        Back-invalidate the block at `address` from the levels above, which
+        may hold it as several smaller blocks. Returns whether any copy up
+        there was dirty.
+        """
+        dirty = False
+        for upper in self.uppers:
+            for block in range(address, address + self.block_size, upper.block_size):
+                if upper.invalidate(block):
+                    dirty = True
+        return dirty
+    
+    def holds(self, address):
+        """
+        Whether the block is resident, without touching replacement state
+        or allocating a sparse set.
+        """
+        set_index = self.get_set(address)
+        if self.sparse and set_index not in self.tags:
+            return False
+        tag = self.get_tag(address)
+        valid = self.valid[set_index]
+        return any(valid[i] and tag == way for i, way in enumerate(self.tags[set_index]))
+    
+    def clear(self, set_index, index):
+        """
+        Empty a way.
+        """
+        self.tags[set_index][index] = -1
+        self.valid[set_index][index] = False
+        self.dirty[set_index][index] = False
+    
+    def write_back(self, set_index, index):
+        """
+        Write a dirty block that is being evicted back to the next level.
+        """
+        address = self.block_number(set_index, index) << self.block_bits
+        if self.profile is not None:
+            self.profile.writeback(address)
+        self.next_level.writeback(address)
+    
+    def block_number(self, set_index, index):
+        """
+        Reconstruct the block number of the line held in a given way.
+        """
+        return (self.tags[set_index][index] << self.set_bits) | set_index
+    
+    def set_prefetcher(self, prefetcher):
+        self.prefetcher = prefetcher
+    
+    def set_classifier(self, classifier):
+        self.classifier = classifier
+    
+    def set_profile(self, profile):
+        self.profile = profile
+    
+    def train(self, address, hit, read):
+        """
+        Account for a demand access to a prefetched block, then let the
+        prefetcher observe the access and issue whatever it asks for.
+        """
+        global clock
+        
+        miss = not hit
+        if hit and self.prefetched:
+            ready = self.prefetched.pop(address >> self.block_bits, None)
+            if ready is not None:
+                # first demand use of a prefetched block
+                self.useful_prefetches += 1
+                miss = True
+                if clock < ready:
+                    self.late_prefetches += 1
+                    if read:
+                        # stall for the rest of the in-flight fill
+                        clock = ready
+        
+        for prefetch_address in self.prefetcher.observe(address, miss):
+            self.prefetch(prefetch_address)
+    
+    def prefetch(self, address):
+        """
+        Bring a block into the cache from DRAM off the critical path. The fill
+        does not advance the clock; its energy and DRAM traffic are tracked
+        apart from demand accesses.
+        """
+        if address < 0 or address > 0xFFFFFFFF:
+            return
+        
+        set_index = self.get_set(address)
+        tag = self.get_tag(address)
+        
+        invalid = -1
+        for i in range(len(self.tags[set_index])):
+            if self.valid[set_index][i]:
+                if tag == self.tags[set_index][i]:
+                    # already resident, nothing to do
+                    return
+            else:
+                invalid = i
+        
+        self.prefetches += 1
+        self.prefetch_active_energy += (self.active_consumption * self.access_time + self.transfer_penalty)
+        self.next_level.prefetch(address)
+        
+        dirty = False
+        if invalid != -1:
+            index = invalid
+        else:
+            index = self.victim_way(set_index)
+            
+            # evict the victim from the levels above to maintain inclusivity
+            victim_address = self.block_number(set_index, index) << self.block_bits
+            for upper in self.uppers:
+                if upper.invalidate(victim_address):
+                    self.dirty[set_index][index] = True
+            
+            if self.dirty[set_index][index]:
+                self.write_back(set_index, index)
+            
+            if self.prefetched:
+                self.drop_prefetched(set_index, index)
+        
+        self.install(set_index, index, tag, dirty)
+        self.prefetched[address >> self.block_bits] = clock + self.next_level.access_time
+    
+    def drop_prefetched(self, set_index, index):
+        """
+        A block is leaving the cache; if it was prefetched and never used,
+        the prefetch was useless.
+        """
+        if self.valid[set_index][index]:
+            block = self.block_number(set_index, index)
+            if self.prefetched.pop(block, None) is not None:
+                self.useless_prefetches += 1
     
     def active_energy(self):
-        return self.total_active_energy
+        return self.total_active_energy + self.prefetch_active_energy
+    
+    def prefetch_energy(self):
+        return self.prefetch_active_energy
     
     def idle_energy(self):
         return self.idle_consumption * clock
     
+    def writeback(self, address):
+        """
+        Absorb a dirty block written back from the level above.
+        """
+        self.write(address)
+    
     def set_l1(self, data, instr):
-        self.l1_data = data
-        self.l1_instr = instr
+        self.uppers = [data, instr]
+    
+    def set_uppers(self, uppers):
+        self.uppers = list(uppers)
     
     def get_accesses(self):
         return self.accesses
@@ -313,17 +868,188 @@ class L2Cache:
     def get_hits(self):
         return self.accesses - self.misses
     
+    def get_prefetches(self):
+        return self.prefetches
+    
+    def coverage(self):
+        """
+        Fraction of would-be demand misses removed by prefetching.
+        """
+        total = self.useful_prefetches + self.misses
+        return self.useful_prefetches / total if total > 0 else 0
+    
+    def accuracy(self):
+        """
+        Fraction of issued prefetches that saw a demand access.
+        """
+        return self.useful_prefetches / self.prefetches if self.prefetches > 0 else 0
+    
+    def timeliness(self):
+        """
+        Fraction of useful prefetches that arrived before they were needed.
+        """
+        if self.useful_prefetches == 0:
+            return 0
+        return (self.useful_prefetches - self.late_prefetches) / self.useful_prefetches
+    
+class DirectMappedL2Cache(L2Cache):
+    """
+    Lower-level cache with one way per set; the lookup is a single compare.
+    """
+    def read(self, address):
+        global clock
+        
+        self.accesses += 1
+        self.total_active_energy += (self.active_consumption * self.access_time + self.transfer_penalty)
+        clock += self.access_time
+        
+        set_index = self.get_set(address)
+        tag = self.get_tag(address)
+        
+        if self.valid[set_index][0]:
+            if tag == self.tags[set_index][0]:
+                # read hit
+                if self.classifier is not None:
+                    self.classifier.access(address >> self.block_bits, True)
+                if self.prefetcher is not None:
+                    self.train(address, True, True)
+                return True
+            self.evict(address, False)
+        else:
+            self.invalid_miss(set_index, 0, tag, False)
+        
+        if self.prefetcher is not None:
+            self.train(address, False, True)
+        return False
+    
+    def write(self, address):
+        self.accesses += 1
+        self.total_active_energy += (self.active_consumption * self.access_time + self.transfer_penalty)
+        
+        set_index = self.get_set(address)
+        tag = self.get_tag(address)
+        
+        if self.valid[set_index][0]:
+            if tag == self.tags[set_index][0]:
+                # write hit
+                self.dirty[set_index][0] = True
+                if self.classifier is not None:
+                    self.classifier.access(address >> self.block_bits, True)
+                if self.prefetcher is not None:
+                    self.train(address, True, False)
+                return True
+            self.evict(address, True)
+        else:
+            self.invalid_miss(set_index, 0, tag, True)
+        
+        if self.prefetcher is not None:
+            self.train(address, False, False)
+        return False
+    
+    
+class FullyAssociativeL2Cache(L2Cache):
+    """
+    Lower-level cache with a single set. A tag -> way map replaces the scan
+    over the ways, and free ways are kept in a heap so fills pick the same
+    way the generic scan would (the highest invalid one).
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.where = {}
+        self.free = [-i for i in range(self.associativity)]
+        heapq.heapify(self.free)
+    
+    def read(self, address):
+        global clock
+        
+        self.accesses += 1
+        self.total_active_energy += (self.active_consumption * self.access_time + self.transfer_penalty)
+        clock += self.access_time
+        
+        tag = self.get_tag(address)
+        index = self.where.get(tag)
+        
+        if index is not None:
+            # read hit
+            if self.lru:
+                self.touch(0, index)
+            if self.classifier is not None:
+                self.classifier.access(address >> self.block_bits, True)
+            if self.prefetcher is not None:
+                self.train(address, True, True)
+            return True
+        
+        if self.free:
+            self.invalid_miss(0, -self.free[0], tag, False)
+        else:
+            self.evict(address, False)
+        
+        if self.prefetcher is not None:
+            self.train(address, False, True)
+        return False
+    
+    def write(self, address):
+        self.accesses += 1
+        self.total_active_energy += (self.active_consumption * self.access_time + self.transfer_penalty)
+        
+        tag = self.get_tag(address)
+        index = self.where.get(tag)
+        
+        if index is not None:
+            # write hit
+            self.dirty[0][index] = True
+            if self.lru:
+                self.touch(0, index)
+            if self.classifier is not None:
+                self.classifier.access(address >> self.block_bits, True)
+            if self.prefetcher is not None:
+                self.train(address, True, False)
+            return True
+        
+        if self.free:
+            self.invalid_miss(0, -self.free[0], tag, True)
+        else:
+            self.evict(address, True)
+        
+        if self.prefetcher is not None:
+            self.train(address, False, False)
+        return False
+    
+    def install(self, set_index, index, tag, dirty):
+        if self.valid[0][index]:
+            del self.where[self.tags[0][index]]
+        else:
+            # fills of invalid ways always take the top of the heap
+            heapq.heappop(self.free)
+        self.where[tag] = index
+        super().install(set_index, index, tag, dirty)
+    
+    def holds(self, address):
+        return self.get_tag(address) in self.where
+    
+    def clear(self, set_index, index):
+        del self.where[self.tags[0][index]]
+        heapq.heappush(self.free, -index)
+        super().clear(set_index, index)
+    
+    
 class DRAM:
-    def __init__(self):
-        self.access_time = 4.5e-8       # account for additive
-        self.idle_consumption = 0.8
-        self.active_consumption = 4
-        self.transfer_penalty = 6.45e-10    # transfer from dram to l1
+    def __init__(self, access_time=4.5e-8, idle_consumption=0.8, active_consumption=4, transfer_penalty=6.45e-10):
+        self.access_time = access_time       # account for additive
+        self.idle_consumption = idle_consumption
+        self.active_consumption = active_consumption
+        self.transfer_penalty = transfer_penalty    # transfer from dram to l1
         
         self.total_active_energy = 0
         self.accesses = 0
+        
+        self.prefetch_active_energy = 0
+        self.prefetches = 0
+        
+        # optional per-region traffic and energy attribution
+        self.profile = None
     
-    def read(self):
+    def read(self, address=None):
         """
         Compute the time and energy for a read from DRAM.
         """
@@ -332,16 +1058,36 @@ class DRAM:
         self.accesses += 1
         clock += self.access_time
         self.total_active_energy += (self.active_consumption * self.access_time + self.transfer_penalty)
+        if self.profile is not None and address is not None:
+            self.profile.energy(address, self.active_consumption * self.access_time + self.transfer_penalty)
     
-    def writeback(self):
+    def writeback(self, address=None):
         """
         Compute the energy for a writeback to DRAM.
         """
         self.accesses += 1
         self.total_active_energy += (self.active_consumption * self.access_time + self.transfer_penalty)
+        if self.profile is not None and address is not None:
+            self.profile.energy(address, self.active_consumption * self.access_time + self.transfer_penalty)
+    
+    def prefetch(self, address=None):
+        """
+        Compute the energy for a prefetch read from DRAM. Prefetches are
+        off the critical path, so the clock does not advance.
+        """
+        self.prefetches += 1
+        self.prefetch_active_energy += (self.active_consumption * self.access_time + self.transfer_penalty)
+        if self.profile is not None and address is not None:
+            self.profile.energy(address, self.active_consumption * self.access_time + self.transfer_penalty)
+    
+    def set_profile(self, profile):
+        self.profile = profile
     
     def active_energy(self):
-        return self.total_active_energy
+        return self.total_active_energy + self.prefetch_active_energy
+    
+    def prefetch_energy(self):
+        return self.prefetch_active_energy
     
     def idle_energy(self):
         return self.idle_consumption * clock
@@ -349,36 +1095,382 @@ class DRAM:
     def get_accesses(self):
         return self.accesses
     
+    def get_prefetches(self):
+        return self.prefetches
+    
+class EventTiming:
+    """
+    Event-driven, non-blocking timing model. The processor issues one trace
+    line per cycle; misses hold an MSHR at each level they pass through until
+    their fill completes, so misses to different blocks overlap and hits
+    proceed under outstanding misses. The processor only stalls when an MSHR
+    file is full or an instruction fetch misses.
+    """
+    def __init__(self, cycle_time=5e-10, l1_mshrs=4, l2_mshrs=8):
+        if l1_mshrs < 1 or l2_mshrs < 1:
+            raise ValueError("Every MSHR file needs at least one entry")
+        self.cycle_time = cycle_time
+        
+        # outstanding misses per MSHR file: block -> completion time
+        # (0: L1 data, 1: L1 instruction, 2: L2)
+        self.mshrs = [{}, {}, {}]
+        self.limits = [l1_mshrs, l1_mshrs, l2_mshrs]
+        
+        # completion events: (time, mshr file, block)
+        self.events = []
+        
+        self.now = 0
+        self.last_completion = 0
+        
+        self.reads = 0
+        self.read_latency = 0
+        self.miss_latency = 0
+        self.merged_misses = 0
+        self.mshr_stalls = 0
+        self.mshr_stall_time = 0
+        self.fetch_stall_time = 0
+    
+    def retire(self, time):
+        """
+        Free every MSHR whose fill has completed by the given time.
+        """
+        events = self.events
+        while events and events[0][0] <= time:
+            done, index, block = heapq.heappop(events)
+            if self.mshrs[index].get(block) == done:
+                del self.mshrs[index][block]
+    
+    def reserve(self, index):
+        """
+        Make sure an MSHR is free in the given file, stalling the processor
+        until the earliest outstanding fill completes if it is full.
+        """
+        mshrs = self.mshrs[index]
+        if len(mshrs) < self.limits[index]:
+            return
+        
+        self.mshr_stalls += 1
+        while len(mshrs) >= self.limits[index]:
+            done = self.events[0][0]
+            self.retire(done)
+        
+        if done > self.now:
+            self.mshr_stall_time += done - self.now
+            self.now = done
+    
+    def record(self, index, block, completion):
+        """
+        Hold an MSHR for a block until its fill completes.
+        """
+        self.mshrs[index][block] = completion
+        heapq.heappush(self.events, (completion, index, block))
+    
+    def access(self, sim, type_, address):
+        """
+        Issue one trace line at the current processor time.
+        """
+        global clock
+        
+        self.retire(self.now)
+        
+        if type_ == 1:
+            # writes retire into the write buffer without stalling
+            clock = self.now
+            sim.write_access(address)
+        elif type_ == 0 or type_ == 2:
+            data = type_ == 0
+            index = 0 if data else 1
+            block = address >> sim.l2.block_bits
+            
+            clock = self.now
+            level = sim.read_access(address, data)
+            latency = clock - self.now
+            
+            pending = self.mshrs[index].get(block)
+            if pending is not None:
+                # secondary miss, wait on the fill already in flight
+                self.merged_misses += 1
+                completion = max(pending, self.now + latency)
+            elif level == 1:
+                completion = self.now + latency
+            else:
+                self.reserve(index)
+                # an L2 hit can still be on a fill the other L1 started
+                l2_pending = self.mshrs[2].get(block)
+                if level >= 3 and l2_pending is None:
+                    self.reserve(2)
+                
+                start = self.now
+                if l2_pending is not None:
+                    # the other L1 already has this block in flight from DRAM
+                    self.merged_misses += 1
+                    completion = max(l2_pending, start + latency)
+                else:
+                    completion = start + latency
+                    if level >= 3:
+                        self.record(2, block, completion)
+                self.record(index, block, completion)
+                self.miss_latency += completion - start
+            
+            self.reads += 1
+            self.read_latency += completion - self.now
+            self.last_completion = max(self.last_completion, completion)
+            
+            if not data and completion > self.now + self.cycle_time:
+                # the processor cannot run ahead of its instruction stream
+                self.fetch_stall_time += completion - self.now - self.cycle_time
+                self.now = completion - self.cycle_time
+        
+        self.now += self.cycle_time
+        clock = self.now
+    
+    def finish(self):
+        """
+        Drain outstanding misses and return the total simulated time.
+        """
+        self.retire(self.last_completion)
+        return max(self.now, self.last_completion)
+    
+    def total_time(self):
+        return max(self.now, self.last_completion)
+    
+    def average_read_latency(self):
+        return self.read_latency / self.reads if self.reads > 0 else 0
+    
+    def memory_level_parallelism(self):
+        """
+        Average number of misses in flight over the run.
+        """
+        total = self.total_time()
+        return self.miss_latency / total if total > 0 else 0
+    
+    def report(self):
+        print("Event Timing Stats\n")
+        
+        print("L1 MSHRs: {}, L2 MSHRs: {}".format(self.limits[0], self.limits[2]))
+        print("Merged (Secondary) Misses:", self.merged_misses)
+        print("MSHR-Full Stalls:", self.mshr_stalls)
+        print("MSHR Stall Time: {:.10f} s".format(self.mshr_stall_time))
+        print("Instruction Fetch Stall Time: {:.10f} s".format(self.fetch_stall_time))
+        print("Average Read Latency: {:.15f} s".format(self.average_read_latency()))
+        print("Memory-Level Parallelism: {:.6f}\n".format(self.memory_level_parallelism()))
+    
+# today's hierarchy: split direct-mapped L1s, a 256 KiB L2, then DRAM
+DEFAULT_CONFIG = {
+    "l1": {
+        "block_size": 64,
+        "capacity": 1 << 15,
+        "access_time": 5e-10,
+        "idle_consumption": 0.5,
+        "active_consumption": 1,
+    },
+    "levels": [
+        {
+            "name": "L2",
+            "block_size": 64,
+            "capacity": 1 << 18,
+            "associativity": 4,
+            "access_time": 4.5e-9,
+            "idle_consumption": 0.8,
+            "active_consumption": 2,
+            "transfer_penalty": 5e-12,
+            "replacement": "random",
+            "storage": "dense",
+        },
+    ],
+    "dram": {
+        "access_time": 4.5e-8,
+        "idle_consumption": 0.8,
+        "active_consumption": 4,
+        "transfer_penalty": 6.45e-10,
+    },
+}
+
+
+def default_config(l2_assoc=4, l2_capacity=1 << 18, storage="dense"):
+    """
+    The default hierarchy with the L2 knobs CacheSim has always exposed.
+    """
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    config["levels"][0].update(associativity=l2_assoc, capacity=l2_capacity, storage=storage)
+    return config
+
+
+def load_config(path):
+    """
+    Load a hierarchy from a JSON file. Every key is optional: missing L1
+    and DRAM settings fall back to the defaults, and each entry of "levels"
+    (L2 first, then L3, ...) falls back to the default L2 settings.
+    """
+    with open(path) as f:
+        raw = json.load(f)
+    
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    config["l1"].update(raw.get("l1", {}))
+    config["dram"].update(raw.get("dram", {}))
+    if "levels" in raw:
+        config["levels"] = []
+        for i, spec in enumerate(raw["levels"]):
+            level = dict(DEFAULT_CONFIG["levels"][0], name="L{}".format(i + 2))
+            level.update(spec)
+            config["levels"].append(level)
+    
+    if config["l1"].pop("associativity", 1) != 1:
+        raise ValueError("L1 caches are direct-mapped")
+    if not config["levels"]:
+        raise ValueError("At least one level below L1 is required")
+    
+    # a level must hold each block of the one above whole to stay inclusive
+    block_sizes = [config["l1"]["block_size"]] + [level["block_size"] for level in config["levels"]]
+    for upper, lower in zip(block_sizes, block_sizes[1:]):
+        if lower < upper:
+            raise ValueError("Block sizes cannot shrink going down the hierarchy ({} B above {} B)".format(upper, lower))
+    return config
+
+
+def make_cache(spec, next_level):
+    """
+    Build one level below L1, picking the class specialized for its shape
+    so the per-access path carries no dispatch on associativity.
+    """
+    spec = dict(spec)
+    lines = spec["capacity"] // spec["block_size"]
+    associativity = spec.pop("associativity")
+    
+    if associativity == 1:
+        cls = DirectMappedL2Cache
+    elif associativity == lines:
+        cls = FullyAssociativeL2Cache
+    else:
+        cls = L2Cache
+    return cls(associativity, None, None, next_level, **spec)
+
+
+def build_levels(config):
+    """
+    Build the levels below L1 from the bottom up. Returns the list of caches
+    (L2 first) and DRAM; L1s still have to be attached to the L2.
+    """
+    dram = DRAM(**config["dram"])
+    
+    levels = []
+    next_level = dram
+    for spec in reversed(config["levels"]):
+        level = make_cache(spec, next_level)
+        if next_level is not dram:
+            next_level.set_uppers([level])
+        levels.insert(0, level)
+        next_level = level
+    return levels, dram
+
+
+def parse_line(line: str):
+    cols = line.split()
+    
+    assert len(cols) == 3, "Invalid input file format"
+    
+    # Parse, only need type and address
+    type_ = int(cols[0])
+    address = int(cols[1], 16)
+    
+    return type_, address
+
+
+# binary traces (.dinb): packed little-endian records of type and address
+BINARY_RECORD = struct.Struct("<BI")
+
+
+def stream_trace(filename, limit=None):
+    """
+    Yield (type, address) pairs from a Dinero trace one line at a time,
+    without loading the file. Binary .dinb traces are read in blocks.
+    """
+    if filename.endswith('.dinb'):
+        with open(filename, 'rb') as f:
+            records = (record for block in iter(lambda: f.read(BINARY_RECORD.size << 16), b'')
+                       for record in BINARY_RECORD.iter_unpack(block))
+            yield from islice(records, limit)
+        return
+    
+    assert filename.endswith('.din'), "File must be of type .din"
+    with open(filename, 'r') as f:
+        for line in islice(f, limit):
+            yield parse_line(line)
+
+
 class CacheSim:
     """
     A Dinero-based cache simulator.
     """
-    def __init__(self, filename: str, l2_assoc: int = 4):
+    def __init__(self, filename: str = None, l2_assoc: int = 4, prefetcher=None, timing=None, victim_entries: int = 0,
+                 classify_misses: bool = False, region_size: int = 0,
+                 l2_capacity: int = 1 << 18, storage: str = "dense", config=None, limit: int = None):
         """
         Open the Dinero trace file and initialize simulation statistics.
+        `prefetcher` optionally attaches a Prefetcher instance to the L2,
+        `timing` optionally replaces the serial clock with an EventTiming model,
+        a nonzero `victim_entries` puts a victim buffer behind each L1, and
+        `classify_misses` enables 3C miss classification at every level. A
+        nonzero `region_size` attributes misses, writebacks and DRAM energy to
+        address regions of that many bytes. `storage` picks the L2's set
+        storage: "dense", "sparse" (allocated on first touch) or "auto".
+        A `config` (see load_config) replaces the L2 knobs and describes the
+        whole hierarchy, with any number of levels below L1. `limit` only
+        loads that many lines from the start of the trace. With no
+        `filename`, nothing is loaded and accesses are fed through
+        access_many instead.
         """
-        self.name = filename[24:]
-        self.l2_assoc = l2_assoc
+        global clock
+        
+        self.name = filename[len(TRACE_DIR):] if filename is not None else "live"
+        self.timing = timing
+        
+        # each simulation starts from time zero
+        clock = 0
         
-        with open(filename, 'r') as f:
-            assert f.name.endswith('.din'), "File must be of type .din"
-            self.data = f.readlines()
+        if config is None:
+            config = default_config(l2_assoc, l2_capacity, storage)
+        self.config = config
         
-        # caches
-        self.dram = DRAM()
+        if filename is None:
+            # fed live through access_many
+            self.data = []
+        else:
+            with open(filename, 'r') as f:
+                assert f.name.endswith('.din'), "File must be of type .din"
+                self.data = f.readlines() if limit is None else list(islice(f, limit))
+        
+        # caches, built from the bottom up
+        self.levels, self.dram = build_levels(config)
         
-        self.l2 = L2Cache(
-            associativity=self.l2_assoc,
-            l1_data=None,
-            l1_instr=None,
-            dram=self.dram
-        )
+        self.l2 = self.levels[0]
+        self.l2_assoc = self.l2.associativity
         
-        self.l1_data = L1Cache(self.l2)
-        self.l1_instruction = L1Cache(self.l2)
+        self.l1_data = L1Cache(self.l2, **config["l1"])
+        self.l1_instruction = L1Cache(self.l2, **config["l1"])
         
         # l2 initialized before l1, so need this
         self.l2.set_l1(self.l1_data, self.l1_instruction)
+        
+        if len(self.levels) > 1:
+            # bind the deeper chain once rather than looping on every access
+            self.read_access = self.deep_read_access
+            self.write_access = self.deep_write_access
+        
+        if prefetcher is not None:
+            self.l2.set_prefetcher(prefetcher)
+        
+        if victim_entries > 0:
+            self.l1_data.set_victim(VictimCache(victim_entries))
+            self.l1_instruction.set_victim(VictimCache(victim_entries))
+        
+        if classify_misses:
+            for cache in [self.l1_data, self.l1_instruction] + self.levels:
+                cache.set_classifier(MissClassifier(cache.capacity // cache.block_size))
+        
+        if region_size > 0:
+            for level in [self.l1_data, self.l1_instruction] + self.levels + [self.dram]:
+                level.set_profile(RegionProfile(region_size))
     
     
     """
@@ -387,14 +1479,35 @@ class CacheSim:
 
     def read_access(self, address, data=True):
         """
-        Perform a read.
+        Perform a read. Returns the level that supplied the block
+        (1 for L1, 2 for L2, 3 for DRAM).
         """
         l1_cache = self.l1_data if data else self.l1_instruction
         l1_hit = l1_cache.read(address)
-        if not l1_hit:
-            l2_hit = self.l2.read(address)
-            if not l2_hit:
-                self.dram.read()
+        if l1_hit:
+            return 1
+        l2_hit = self.l2.read(address)
+        if l2_hit:
+            return 2
+        self.dram.read(address)
+        return 3
+    
+    def deep_read_access(self, address, data=True):
+        """
+        Perform a read through a hierarchy with more than one level below
+        L1. Returns the level that supplied the block (1 for L1, 2 for L2,
+        ..., len(levels) + 2 for DRAM).
+        """
+        l1_cache = self.l1_data if data else self.l1_instruction
+        if l1_cache.read(address):
+            return 1
+        level = 2
+        for cache in self.levels:
+            if cache.read(address):
+                return level
+            level += 1
+        self.dram.read(address)
+        return level
 
     def write_access(self, address):
         """
@@ -403,6 +1516,19 @@ class CacheSim:
         l1_hit = self.l1_data.write(address)
         if not l1_hit:
             self.l2.write(address)
+    
+    def deep_write_access(self, address):
+        """
+        Perform a write through a hierarchy with more than one level below
+        L1. A write miss allocates the block at every level down to the
+        first one holding it, keeping the levels inclusive, and as with a
+        single L2 it is never read from DRAM.
+        """
+        if self.l1_data.write(address):
+            return
+        for cache in self.levels:
+            if cache.write(address):
+                return
             
     def line_access(self, type_: int, address: int):
         """
@@ -416,20 +1542,42 @@ class CacheSim:
             self.read_access(address, data=False)
     
 
+    def access_many(self, types, addresses):
+        """
+        Apply a batch of accesses given as two equal-length sequences of
+        Dinero types and addresses (e.g. bytes and array('I')), in order.
+        """
+        if self.timing is not None:
+            access = self.timing.access
+            for type_, address in zip(types, addresses):
+                access(self, type_, address)
+            return
+        
+        read = self.read_access
+        write = self.write_access
+        for type_, address in zip(types, addresses):
+            if type_ == 0:
+                read(address, True)
+            elif type_ == 1:
+                write(address)
+            elif type_ == 2:
+                read(address, False)
+    
+
     def run(self):
         """
-        Run the cache simulator.
+        Run the cache simulator. Returns its stats (see stats()).
         """
-        def parse_line(line: str):
-            cols = line.split()
-            
-            assert len(cols) == 3, "Invalid input file format"
+        if self.timing is not None:
+            global clock
             
-            # Parse, only need type and address
-            type_ = int(cols[0])
-            address = int(cols[1], 16)
+            for line in self.data:
+                type_, address = parse_line(line)
+                self.timing.access(self, type_, address)
             
-            return type_, address
+            # idle energy is charged over the overlapped run time
+            clock = self.timing.finish()
+            return self.stats()
         
         for line in self.data:
             type_, address = parse_line(line)
@@ -437,6 +1585,8 @@ class CacheSim:
             # access the data and handle misses accordingly
             self.line_access(type_, address)
         
+        return self.stats()
+        
     def report(self):
         """
         Output hits, misses, energy consumption, and access time.
@@ -444,47 +1594,136 @@ class CacheSim:
         # add units later
         print("Cache Access Stats for {}\n".format(self.name))
 
-        print("Hits in L1 Data:", self.l1_data.get_hits())
-        print("Misses in L1 Data:", self.l1_data.get_misses())
-        print("L1 Data Hit Rate: {:.6f}\n".format(self.l1_data.get_hits() / self.l1_data.get_accesses() if self.l1_data.get_accesses() > 0 else 0))
-
-        print("Hits in L1 Instruction:", self.l1_instruction.get_hits())
-        print("Misses in L1 Instruction:", self.l1_instruction.get_misses())
-        print("L1 Instruction Hit Rate: {:.6f}\n".format(self.l1_instruction.get_hits() / self.l1_instruction.get_accesses() if self.l1_instruction.get_accesses() > 0 else 0))
+        stats = self.stats()
         
-        print("Hits in L2:", self.l2.get_hits())
-        print("Misses in L2:", self.l2.get_misses())
-        print("L2 Hit Rate: {:.6f}\n".format(self.l2.get_hits() / self.l2.get_accesses() if self.l2.get_accesses() > 0 else 0))
+        for level in stats.caches:
+            print("Hits in {}:".format(level.name), level.hits)
+            print("Misses in {}:".format(level.name), level.misses)
+            print("{} Hit Rate: {:.6f}\n".format(level.name, level.hit_rate))
         
-        print(f"DRAM Accesses: {self.dram.get_accesses()}\n")
+        print(f"DRAM Accesses: {stats.dram.accesses}\n")
         
-        print("Performance Stats\n")
-
-        print("Idle Consumption from L1 Data: {:.9f} J".format((self.l1_data.idle_energy())))
-        print("Active Consumption from L1 Data: {:.9f} J".format((self.l1_data.active_energy())))
-        print("Total Consumption from L1 Data: {:.9f} J\n".format(self.l1_data.idle_energy() + self.l1_data.active_energy()))
+        if self.l2.prefetcher is not None:
+            self.report_prefetch()
         
-        print("Idle Consumption from L1 Instruction: {:.9f} J".format((self.l1_instruction.idle_energy())))
-        print("Active Consumption from L1 Instruction: {:.9f} J".format((self.l1_instruction.active_energy())))
-        print("Total Consumption from L1 Instruction: {:.9f} J\n".format(self.l1_instruction.idle_energy() + self.l1_instruction.active_energy()))
+        if self.timing is not None:
+            self.timing.report()
         
-        print("Idle Consumption from L2: {:.9f} J".format((self.l2.idle_energy())))
-        print("Active Consumption from L2: {:.9f} J".format((self.l2.active_energy())))
-        print("Total Consumption from L2: {:.9f} J\n".format(self.l2.idle_energy() + self.l2.active_energy()))
+        if self.l1_data.victim is not None:
+            self.report_victim()
         
-        print("Idle Consumption from DRAM: {:.9f} J".format((self.dram.idle_energy())))
-        print("Active Consumption from DRAM: {:.9f} J".format((self.dram.active_energy())))
-        print("Total Consumption from DRAM: {:.9f} J\n".format(self.dram.idle_energy() + self.dram.active_energy()))
+        if self.l2.classifier is not None:
+            self.report_misses()
         
-        print("Total Energy Consumption: {:.9f} J\n".format(self.total_energy()))
+        if self.l2.profile is not None:
+            self.report_hotspots()
         
-        print("Total Time: {:.10f} s".format(self.total_time()))
-        print("Average Memory Access Time: {:.15f} s\n".format((self.total_time()) / self.total_accesses()))
+        print("Performance Stats\n")
+
+        for level in stats.levels:
+            print("Idle Consumption from {}: {:.9f} J".format(level.name, level.idle_energy))
+            print("Active Consumption from {}: {:.9f} J".format(level.name, level.active_energy))
+            print("Total Consumption from {}: {:.9f} J\n".format(level.name, level.energy))
+        
+        print("Total Energy Consumption: {:.9f} J\n".format(stats.total_energy))
+        
+        print("Total Time: {:.10f} s".format(stats.total_time))
+        print("Average Memory Access Time: {:.15f} s\n".format(stats.total_time / self.total_accesses()))
         
         # print(Counter(self.l1_data.valid))
         # print(Counter(self.l1_instruction.valid))
         # print(Counter(self.l2.valid))
     
+    def stats(self):
+        """
+        Collect per-level counters and energy, and the run totals, into a
+        SimStats record.
+        """
+        return SimStats.of(self)
+    
+    def report_hotspots(self, n=10):
+        """
+        Output the top-n address regions by misses, writebacks and DRAM energy.
+        """
+        def show(label, top, total, fmt):
+            print(label)
+            for region, value in top:
+                share = value / total if total > 0 else 0
+                print(("  0x{:08x}  " + fmt + "  ({:.2%})").format(profile.region_address(region), value, share))
+            print()
+        
+        print("Hotspots ({}-byte regions, top {})\n".format(self.l2.profile.granularity, n))
+        
+        caches = [("L1 Data", self.l1_data), ("L1 Instruction", self.l1_instruction)]
+        caches += [(cache.name, cache) for cache in self.levels]
+        for name, cache in caches:
+            profile = cache.profile
+            show("Misses in {}:".format(name), profile.top_misses(n), cache.get_misses(), "{:>10}")
+        
+        for cache in self.levels:
+            profile = cache.profile
+            show("Writebacks from {}:".format(cache.name), profile.top_writebacks(n), sum(profile.writebacks.values()), "{:>10}")
+        
+        profile = self.dram.profile
+        show("DRAM Active Consumption:", profile.top_energy(n), self.dram.active_energy(), "{:.9f} J")
+    
+    def report_misses(self):
+        """
+        Output the 3C breakdown of each level's misses.
+        """
+        print("Miss Classification (3C)\n")
+        
+        caches = [("L1 Data", self.l1_data), ("L1 Instruction", self.l1_instruction)]
+        caches += [(cache.name, cache) for cache in self.levels]
+        for name, cache in caches:
+            classifier = cache.classifier
+            print("Compulsory Misses in {}: {}".format(name, classifier.get_compulsory()))
+            print("Capacity Misses in {}: {}".format(name, classifier.get_capacity()))
+            print("Conflict Misses in {}: {}\n".format(name, classifier.get_conflict()))
+    
+    def report_victim(self):
+        """
+        Output victim buffer hits and the L2 traffic and energy they save.
+        """
+        print("Victim Cache Stats ({} entries)\n".format(self.l1_data.victim.entries))
+        
+        for name, l1 in (("L1 Data", self.l1_data), ("L1 Instruction", self.l1_instruction)):
+            victim = l1.victim
+            print("Victim Hits behind {}: {}".format(name, victim.get_hits()))
+            print("Victim Hit Rate behind {}: {:.6f}".format(name, victim.get_hits() / victim.get_accesses() if victim.get_accesses() > 0 else 0))
+            print("L2 Reads Saved:", victim.saved_l2_reads())
+            print("Net L2 Active Energy Saved: {:.9f} J".format(victim.saved_energy(self.l2)))
+            print("Net Time Saved: {:.10f} s\n".format(victim.saved_time(self.l2)))
+        
+        print("Victim Cache Consumption: {:.9f} J\n".format(self.victim_energy()))
+    
+    def victim_energy(self):
+        """
+        Compute the energy consumed by the victim buffers, if any.
+        """
+        energy = 0
+        for l1 in (self.l1_data, self.l1_instruction):
+            if l1.victim is not None:
+                energy += l1.victim.idle_energy() + l1.victim.active_energy()
+        return energy
+    
+    def report_prefetch(self):
+        """
+        Output prefetcher coverage, accuracy, timeliness and cost.
+        """
+        print("Prefetch Stats ({})\n".format(type(self.l2.prefetcher).__name__))
+        
+        print("Prefetches Issued:", self.l2.get_prefetches())
+        print("Useful Prefetches:", self.l2.useful_prefetches)
+        print("Late Prefetches:", self.l2.late_prefetches)
+        print("Useless Prefetches (evicted unused):", self.l2.useless_prefetches)
+        print("Coverage: {:.6f}".format(self.l2.coverage()))
+        print("Accuracy: {:.6f}".format(self.l2.accuracy()))
+        print("Timeliness: {:.6f}".format(self.l2.timeliness()))
+        print(f"DRAM Prefetch Reads: {self.dram.get_prefetches()}")
+        print("Prefetch Consumption in L2: {:.9f} J".format(self.l2.prefetch_energy()))
+        print("Prefetch Consumption in DRAM: {:.9f} J\n".format(self.dram.prefetch_energy()))
+    
     def total_time(self):
         """
         Compute the total time processing all data.
@@ -497,25 +1736,43 @@ class CacheSim:
         """
         return self.l1_data.idle_energy() + self.l1_data.active_energy() + \
             self.l1_instruction.idle_energy() + self.l1_instruction.active_energy() + \
-            self.l2.idle_energy() + self.l2.active_energy() + \
-            self.dram.idle_energy() + self.dram.active_energy()
+            sum(cache.idle_energy() + cache.active_energy() for cache in self.levels) + \
+            self.dram.idle_energy() + self.dram.active_energy() + \
+            self.victim_energy()
     
     def total_accesses(self):
         """
         Compute the total number of accesses by each memory structure.
         """
         return self.l1_data.get_accesses() + self.l1_instruction.get_accesses() + \
-            self.l2.get_accesses() + self.dram.get_accesses()
+            sum(cache.get_accesses() for cache in self.levels) + self.dram.get_accesses()
 
 def main():
-    # Assert that we have an input file
-    if len(sys.argv) != 2:
-        print("Usage: python CacheSim.py <input_file> or sim")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Dinero-based cache simulator.")
+    parser.add_argument("input_file", help="trace in ./Traces/Spec_Benchmark/")
+    parser.add_argument("--config", help="JSON hierarchy description; overrides the L2 options")
+    parser.add_argument("--l2-assoc", type=int, default=4, help="L2 set associativity")
+    parser.add_argument("--l2-size", type=int, default=1 << 18, metavar="BYTES", help="L2 capacity")
+    parser.add_argument("--storage", choices=["dense", "sparse", "auto"], default="dense", help="L2 set storage")
+    parser.add_argument("--prefetch", choices=sorted(PREFETCHERS), help="attach a prefetcher to the L2")
+    parser.add_argument("--victim", type=int, default=0, metavar="ENTRIES", help="victim buffer entries behind each L1")
+    parser.add_argument("--classify-misses", action="store_true", help="break misses down into compulsory, capacity and conflict")
+    parser.add_argument("--hotspots", type=int, default=0, metavar="BYTES", help="attribute misses and DRAM energy to regions of this size")
+    parser.add_argument("--timing", choices=["serial", "event"], default="serial", help="timing model")
+    parser.add_argument("--l1-mshrs", type=int, default=4, help="MSHRs per L1 in event timing")
+    parser.add_argument("--l2-mshrs", type=int, default=8, help="L2 MSHRs in event timing")
+    args = parser.parse_args()
+    if args.l1_mshrs < 1 or args.l2_mshrs < 1:
+        parser.error("--l1-mshrs and --l2-mshrs must be at least 1")
+    
+    filename = TRACE_DIR + args.input_file
     
-    filename = "./Traces/Spec_Benchmark/" + sys.argv[1]
+    config = load_config(args.config) if args.config else None
+    prefetcher = PREFETCHERS[args.prefetch]() if args.prefetch else None
+    timing = EventTiming(l1_mshrs=args.l1_mshrs, l2_mshrs=args.l2_mshrs) if args.timing == "event" else None
     
-    simulator = CacheSim(filename)
+    simulator = CacheSim(filename, args.l2_assoc, prefetcher, timing, args.victim, args.classify_misses, args.hotspots,
+                         args.l2_size, args.storage, config)
     simulator.run()
     simulator.report()
 
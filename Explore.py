@@ -0,0 +1,221 @@
+import argparse
+import csv
+import itertools
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from CacheSimulator import TRACE_DIR, CacheSim, default_config
+
+# design space searched by default
+GRID = {
+    "l1_size": [1 << 14, 1 << 15, 1 << 16],
+    "l2_size": [1 << 17, 1 << 18, 1 << 19, 1 << 20],
+    "block_size": [32, 64, 128],
+    "l2_assoc": [2, 4, 8, 16],
+    "replacement": ["random", "lru"],
+}
+
+# today's hierarchy, where the guided search starts
+BASELINE = {"l1_size": 1 << 15, "l2_size": 1 << 18, "block_size": 64, "l2_assoc": 4, "replacement": "random"}
+
+# First-order scaling of the baseline timing and power with geometry, so
+# larger or more associative caches are not free. Leakage grows with
+# capacity; access time and active power grow with wire length (~sqrt of
+# capacity) and with the number of ways read in parallel.
+LEAKAGE_EXPONENT = 1.0
+WIRE_EXPONENT = 0.5
+WAYS_EXPONENT = 0.1
+
+
+def scale(spec, capacity, associativity=1, base_associativity=1):
+    """
+    Scale a level's default timing and power from its baseline geometry to
+    the given one.
+    """
+    size = capacity / spec["capacity"]
+    ways = associativity / base_associativity
+
+    spec["access_time"] *= size ** WIRE_EXPONENT * ways ** WAYS_EXPONENT
+    spec["active_consumption"] *= size ** WIRE_EXPONENT * ways ** WAYS_EXPONENT
+    spec["idle_consumption"] *= size ** LEAKAGE_EXPONENT
+    spec["capacity"] = capacity
+
+
+def make_config(point):
+    """
+    Build a hierarchy config for one design point.
+    """
+    config = default_config()
+
+    l1 = config["l1"]
+    scale(l1, point["l1_size"])
+    l1["block_size"] = point["block_size"]
+
+    l2 = config["levels"][0]
+    scale(l2, point["l2_size"], point["l2_assoc"], l2["associativity"])
+    l2.update(
+        associativity=point["l2_assoc"],
+        block_size=point["block_size"],
+        replacement=point["replacement"],
+        storage="auto",
+    )
+    return config
+
+
+def valid(point):
+    return point["l2_size"] > point["l1_size"] and \
+        point["l2_size"] >= point["l2_assoc"] * point["block_size"]
+
+
+def grid_points(grid=GRID):
+    """
+    Enumerate every valid point of the grid.
+    """
+    keys = list(grid)
+    points = (dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys)))
+    return [point for point in points if valid(point)]
+
+
+def neighbors(point, grid=GRID):
+    """
+    Points one step away along a single parameter.
+    """
+    result = []
+    for key, values in grid.items():
+        i = values.index(point[key])
+        for j in (i - 1, i + 1):
+            if 0 <= j < len(values):
+                neighbor = dict(point, **{key: values[j]})
+                if valid(neighbor):
+                    result.append(neighbor)
+    return result
+
+
+def key(point):
+    return tuple(point[name] for name in GRID)
+
+
+def evaluate(job):
+    """
+    Simulate one design point on a trace (or its first `limit` lines).
+    Runs in a worker process.
+    """
+    filename, point, limit, seed = job
+    random.seed(seed)
+
+    simulator = CacheSim(filename, config=make_config(point), limit=limit)
+    simulator.run()
+
+    energy = simulator.total_energy()
+    time = simulator.total_time()
+    return {"point": point, "energy": energy, "time": time, "edp": energy * time}
+
+
+def evaluate_all(pool, filename, points, limit, seed):
+    jobs = [(filename, point, limit, seed) for point in points]
+    return list(pool.map(evaluate, jobs))
+
+
+def dominates(a, b, slack=0.0):
+    """
+    Whether result a beats b on both energy and time, by at least a
+    relative margin of `slack` on each.
+    """
+    return a["energy"] * (1 + slack) <= b["energy"] and a["time"] * (1 + slack) <= b["time"] and \
+        (a["energy"] < b["energy"] or a["time"] < b["time"])
+
+
+def pareto_front(results, slack=0.0):
+    """
+    Results not dominated by any other. A positive slack only discards
+    results that are clearly dominated, which is what pruning on noisy
+    prefix estimates needs.
+    """
+    front = [r for r in results if not any(dominates(other, r, slack) for other in results if other is not r)]
+    return sorted(front, key=lambda r: r["energy"])
+
+
+def guided_points(pool, filename, start, limit, seed):
+    """
+    Hill-climb on energy x delay from a starting point, evaluating each
+    step's neighbors on a trace prefix. Returns every point visited.
+    """
+    visited = {}
+    current = start
+    while True:
+        todo = [point for point in [current] + neighbors(current) if key(point) not in visited]
+        for result in evaluate_all(pool, filename, todo, limit, seed):
+            visited[key(result["point"])] = result
+
+        best = min(visited.values(), key=lambda r: r["edp"])
+        if key(best["point"]) == key(current):
+            return [result["point"] for result in visited.values()]
+        current = best["point"]
+
+
+def explore(filename, points, stages, slack=0.05, workers=None, seed=0):
+    """
+    Successively evaluate candidates on longer trace prefixes, keeping only
+    those not clearly dominated, then run the survivors on the full trace.
+    Returns the final Pareto front and the number of simulations per stage.
+    """
+    counts = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for limit in stages:
+            results = evaluate_all(pool, filename, points, limit, seed)
+            counts.append((limit, len(points)))
+            points = [result["point"] for result in pareto_front(results, slack)]
+
+        results = evaluate_all(pool, filename, points, None, seed)
+        counts.append((None, len(points)))
+
+    return pareto_front(results), counts
+
+
+def write_front(front, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(list(GRID) + ["Total Energy (J)", "Total Time (s)", "Energy x Delay (J s)"])
+        for result in front:
+            writer.writerow([result["point"][name] for name in GRID] + [result["energy"], result["time"], result["edp"]])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Design-space exploration over cache geometries.")
+    parser.add_argument("input_file", help="trace in ./Traces/Spec_Benchmark/")
+    parser.add_argument("--search", choices=["grid", "guided"], default="grid")
+    parser.add_argument("--stages", default="20000,100000", help="comma-separated trace prefixes used for pruning")
+    parser.add_argument("--slack", type=float, default=0.05, help="relative margin a candidate must be dominated by to be pruned")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="pareto_front.csv")
+    args = parser.parse_args()
+
+    filename = TRACE_DIR + args.input_file
+    stages = [int(stage) for stage in args.stages.split(",") if stage]
+
+    if args.search == "grid":
+        points = grid_points()
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            points = guided_points(pool, filename, BASELINE, stages[0] if stages else None, args.seed)
+
+    print("Exploring {} design points for {}".format(len(points), args.input_file))
+    front, counts = explore(filename, points, stages, args.slack, args.workers, args.seed)
+
+    for limit, count in counts:
+        print("{} simulations on {}".format(count, "the full trace" if limit is None else "{} lines".format(limit)))
+
+    print("\nPareto front (energy vs time):")
+    for result in front:
+        print("  {}  {:.9f} J  {:.10f} s".format(result["point"], result["energy"], result["time"]))
+
+    best = min(front, key=lambda r: r["edp"])
+    print("\nBest energy x delay: {}  ({:.6e} J s)".format(best["point"], best["edp"]))
+
+    write_front(front, args.output)
+    print("Pareto front written to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
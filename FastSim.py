@@ -0,0 +1,494 @@
+import argparse
+import copy
+import heapq
+import os
+import random
+import time
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+
+import CacheSimulator as sim
+from CacheSimulator import TRACE_DIR, CacheSim, FullyAssociativeL2Cache, default_config, load_config, stream_trace
+
+try:
+    import numpy as np
+    from numba import njit
+except ImportError:
+    njit = None
+
+# random words drawn per refill of the kernel's replacement buffer
+WORDS = 1 << 16
+
+# a random victim is drawn by rejection, so keep enough words for any single draw
+RESERVE = 64
+
+# indexes into the kernel's counter and energy arrays
+L1D_ACCESSES, L1D_MISSES, L1I_ACCESSES, L1I_MISSES, L2_ACCESSES, L2_MISSES, DRAM_ACCESSES, STAMP, WORD = range(9)
+CLOCK, L1D_ENERGY, L1I_ENERGY, L2_ENERGY, DRAM_ENERGY = range(5)
+
+
+if njit is not None:
+    # value of each byte as a hex digit, -1 for separators
+    HEX = np.full(256, -1, dtype=np.int8)
+    for digit, char in enumerate(b"0123456789abcdef"):
+        HEX[char] = digit
+    for digit, char in enumerate(b"ABCDEF"):
+        HEX[char] = 10 + digit
+
+    @njit(cache=True)
+    def parse_din(buffer, hex_digits, types, addresses):
+        """
+        Parse Dinero text ("<type> <hex address> <size>" per line) into the
+        given arrays. The buffer must end with a newline. Returns the number
+        of records parsed.
+        """
+        n = 0
+        i = 0
+        end = len(buffer)
+        while i < end and n < len(types):
+            char = buffer[i]
+            if char <= 32:
+                # blank line or leading whitespace
+                i += 1
+                continue
+
+            types[n] = char - 48
+            i += 1
+            while i < end and hex_digits[buffer[i]] < 0:
+                i += 1
+            if i >= end:
+                break
+
+            # the digits and the size column both stop at the closing newline
+            address = 0
+            digit = hex_digits[buffer[i]]
+            while digit >= 0:
+                address = (address << 4) | digit
+                i += 1
+                digit = hex_digits[buffer[i]]
+            addresses[n] = address
+            n += 1
+
+            while buffer[i] != 10:
+                i += 1
+            i += 1
+        return n
+
+    @njit(cache=True)
+    def simulate(types, addresses, start, l1d_tags, l1d_valid, l1i_tags, l1i_valid, l1_geometry,
+                 tags, valid, dirty, stamps, l2_geometry, lru, words, costs, counts, energy):
+        """
+        Run accesses from `start` on, with the same fill, eviction,
+        back-invalidation and write-back order as the reference classes.
+        Returns the index it stopped at, which is before the end only when
+        the random words need a refill.
+        """
+        l1_block_bits, l1_set_mask, l1_tag_offset, l1_tag_mask = l1_geometry
+        block_bits, set_mask, tag_offset, tag_mask, associativity, draw_bits = l2_geometry
+        l1_time, l1_cost, l2_time, l2_cost, dram_time, dram_cost = costs[0], costs[1], costs[2], costs[3], costs[4], costs[5]
+
+        # accumulated in locals, in the reference's order, and stored on return
+        l1d_accesses, l1d_misses, l1i_accesses, l1i_misses = counts[L1D_ACCESSES], counts[L1D_MISSES], counts[L1I_ACCESSES], counts[L1I_MISSES]
+        l2_accesses, l2_misses, dram_accesses, stamp, word = counts[L2_ACCESSES], counts[L2_MISSES], counts[DRAM_ACCESSES], counts[STAMP], counts[WORD]
+        clock, l1d_energy, l1i_energy, l2_energy, dram_energy = energy[CLOCK], energy[L1D_ENERGY], energy[L1I_ENERGY], energy[L2_ENERGY], energy[DRAM_ENERGY]
+
+        stop = len(types)
+        for i in range(start, len(types)):
+            if not lru and len(words) - word < RESERVE:
+                stop = i
+                break
+
+            type_ = types[i]
+            address = np.int64(addresses[i])
+            l1_set = (address >> l1_block_bits) & l1_set_mask
+            l1_tag = (address >> l1_tag_offset) & l1_tag_mask
+
+            if type_ == 0:
+                l1d_accesses += 1
+                l1d_energy += l1_cost
+                clock += l1_time
+                if l1d_valid[l1_set] and l1d_tags[l1_set] == l1_tag:
+                    continue
+                l1d_misses += 1
+                l1d_tags[l1_set] = l1_tag
+                l1d_valid[l1_set] = 1
+                read = True
+            elif type_ == 2:
+                l1i_accesses += 1
+                l1i_energy += l1_cost
+                clock += l1_time
+                if l1i_valid[l1_set] and l1i_tags[l1_set] == l1_tag:
+                    continue
+                l1i_misses += 1
+                l1i_tags[l1_set] = l1_tag
+                l1i_valid[l1_set] = 1
+                read = True
+            elif type_ == 1:
+                # write-through: the L2 sees every write, hit or miss
+                l1d_accesses += 1
+                l1d_energy += l1_cost
+                if not (l1d_valid[l1_set] and l1d_tags[l1_set] == l1_tag):
+                    l1d_misses += 1
+                    l1d_tags[l1_set] = l1_tag
+                    l1d_valid[l1_set] = 1
+                read = False
+            else:
+                continue
+
+            l2_accesses += 1
+            l2_energy += l2_cost
+            if read:
+                clock += l2_time
+
+            set_index = (address >> block_bits) & set_mask
+            tag = (address >> tag_offset) & tag_mask
+
+            hit = False
+            invalid = -1
+            for way in range(associativity):
+                if valid[set_index, way]:
+                    if tags[set_index, way] == tag:
+                        if not read:
+                            dirty[set_index, way] = 1
+                        if lru:
+                            stamps[set_index, way] = stamp
+                            stamp += 1
+                        hit = True
+                        break
+                else:
+                    invalid = way
+            if hit:
+                continue
+
+            l2_misses += 1
+            if invalid != -1:
+                way = invalid
+            else:
+                if lru:
+                    way = 0
+                    for other in range(1, associativity):
+                        if stamps[set_index, other] < stamps[set_index, way]:
+                            way = other
+                else:
+                    # random.randint(0, associativity - 1): top bits of 32-bit words, rejecting overshoots
+                    way = words[word] >> (32 - draw_bits)
+                    word += 1
+                    while way >= associativity:
+                        way = words[word] >> (32 - draw_bits)
+                        word += 1
+
+                # back-invalidate the victim from the L1s, as in L2Cache.evict
+                victim_address = (tags[set_index, way] << tag_offset) | (set_index << block_bits)
+                victim_set = (victim_address >> l1_block_bits) & l1_set_mask
+                victim_tag = (victim_address >> l1_tag_offset) & l1_tag_mask
+                if l1d_valid[victim_set] and l1d_tags[victim_set] == victim_tag:
+                    l1d_valid[victim_set] = 0
+                    l1d_tags[victim_set] = -1
+                if l1i_valid[victim_set] and l1i_tags[victim_set] == victim_tag:
+                    l1i_valid[victim_set] = 0
+                    l1i_tags[victim_set] = -1
+
+                if dirty[set_index, way]:
+                    dram_accesses += 1
+                    dram_energy += dram_cost
+
+            tags[set_index, way] = tag
+            valid[set_index, way] = 1
+            dirty[set_index, way] = 0 if read else 1
+            if lru:
+                stamps[set_index, way] = stamp
+                stamp += 1
+
+            if read:
+                dram_accesses += 1
+                clock += dram_time
+                dram_energy += dram_cost
+
+        counts[L1D_ACCESSES], counts[L1D_MISSES], counts[L1I_ACCESSES], counts[L1I_MISSES] = l1d_accesses, l1d_misses, l1i_accesses, l1i_misses
+        counts[L2_ACCESSES], counts[L2_MISSES], counts[DRAM_ACCESSES], counts[STAMP], counts[WORD] = l2_accesses, l2_misses, dram_accesses, stamp, word
+        energy[CLOCK], energy[L1D_ENERGY], energy[L1I_ENERGY], energy[L2_ENERGY], energy[DRAM_ENERGY] = clock, l1d_energy, l1i_energy, l2_energy, dram_energy
+        return stop
+
+
+def load_trace(filename, limit=None):
+    """
+    Read a whole trace into type and address arrays. Addresses are kept as
+    uint32, since no tag or set index uses more than the low 32 bits. The
+    last trace read is kept until the file changes, so repeated runs over it
+    (e.g. the seeds of a sweep) only parse it once; the kernel never writes
+    to the arrays.
+    """
+    stat = os.stat(filename)
+    return read_trace(filename, limit, stat.st_size, stat.st_mtime_ns)
+
+
+@lru_cache(maxsize=1)
+def read_trace(filename, limit, size, mtime):
+    if filename.endswith(".dinb"):
+        records = np.fromfile(filename, dtype=[("type", "u1"), ("address", "<u4")], count=-1 if limit is None else limit)
+        return records["type"].copy(), records["address"].copy()
+
+    assert filename.endswith(".din"), "File must be of type .din or .dinb"
+    # the parser needs the text to end with a newline; a trace that already
+    # does is mapped rather than copied
+    buffer = np.memmap(filename, dtype=np.uint8, mode="r").view(np.ndarray) if size > 0 else np.empty(0, dtype=np.uint8)
+    if size == 0 or buffer[-1] != 10:
+        buffer = np.append(buffer, np.uint8(10))
+        buffer.flags.writeable = False
+
+    # no record is shorter than "0 0 0\n"
+    n = size // 6 + 1
+    if limit is not None:
+        n = min(n, limit)
+    types = np.empty(n, dtype=np.uint8)
+    addresses = np.empty(n, dtype=np.uint32)
+    n = parse_din(buffer, HEX, types, addresses)
+    return types[:n], addresses[:n]
+
+
+def supported(simulator):
+    """
+    Whether the kernel models this hierarchy: split L1s over a single L2
+    of the same block size, then DRAM, with none of the optional extras
+    attached.
+    """
+    l2 = simulator.l2
+    return njit is not None and len(simulator.levels) == 1 and simulator.timing is None and \
+        simulator.l1_data.block_size == l2.block_size and \
+        l2.prefetcher is None and l2.classifier is None and l2.profile is None and \
+        simulator.l1_data.victim is None and simulator.l1_data.classifier is None and simulator.l1_data.profile is None
+
+
+def run_on(simulator, types, addresses):
+    """
+    Simulate accesses held in arrays on an existing CacheSim, which must be
+    supported(). Its state is copied into the kernel's arrays and back, so
+    the objects end up exactly as the reference would leave them and the
+    simulator can go on in either engine.
+    """
+    l1d, l1i, l2, dram = simulator.l1_data, simulator.l1_instruction, simulator.l2, simulator.dram
+
+    l1d_tags, l1d_valid = np.array(l1d.tags, dtype=np.int64), np.array(l1d.valid, dtype=np.uint8)
+    l1i_tags, l1i_valid = np.array(l1i.tags, dtype=np.int64), np.array(l1i.valid, dtype=np.uint8)
+    l1_geometry = (l1d.block_bits, l1d.set_mask, l1d.tag_offset, (1 << (32 - l1d.tag_offset)) - 1)
+
+    ways = l2.associativity
+    tags = np.full((l2.sets, ways), -1, dtype=np.int64)
+    valid = np.zeros((l2.sets, ways), dtype=np.uint8)
+    dirty = np.zeros((l2.sets, ways), dtype=np.uint8)
+    if not l2.sparse and isinstance(l2.valid[0], bytearray):
+        # packed rows, as densify or an earlier run left them
+        tags[:] = np.frombuffer(b"".join(l2.tags), dtype="l").reshape(l2.sets, ways)
+        valid[:] = np.frombuffer(b"".join(l2.valid), dtype=np.uint8).reshape(l2.sets, ways)
+        dirty[:] = np.frombuffer(b"".join(l2.dirty), dtype=np.uint8).reshape(l2.sets, ways)
+    else:
+        for set_index in range(l2.sets) if not l2.sparse else list(l2.tags):
+            tags[set_index] = l2.tags[set_index]
+            valid[set_index] = l2.valid[set_index]
+            dirty[set_index] = l2.dirty[set_index]
+    # LRU order as stamps: untouched sets start in way order, like L2Cache.order
+    stamps = np.tile(np.arange(-ways, 0, dtype=np.int64), (l2.sets, 1))
+    for set_index, order in l2.recency.items():
+        stamps[set_index, list(order)] = np.arange(-ways, 0)
+    l2_geometry = (l2.block_bits, l2.set_mask, l2.tag_offset, (1 << (32 - l2.tag_offset)) - 1, ways, ways.bit_length())
+
+    costs = np.array([
+        l1d.access_time, l1d.active_consumption * l1d.access_time,
+        l2.access_time, l2.active_consumption * l2.access_time + l2.transfer_penalty,
+        dram.access_time, dram.active_consumption * dram.access_time + dram.transfer_penalty,
+    ])
+    counts = np.array([l1d.accesses, l1d.misses, l1i.accesses, l1i.misses, l2.accesses, l2.misses, dram.accesses, 0, 0], dtype=np.int64)
+    energy = np.array([sim.clock, l1d.total_active_energy, l1i.total_active_energy, l2.total_active_energy, dram.total_active_energy], dtype=np.float64)
+
+    # replacement draws come from the random module's own Mersenne Twister state
+    state = random.getstate()
+    generator = np.random.MT19937()
+    generator.state = {"bit_generator": "MT19937", "state": {"key": np.array(state[1][:624], dtype=np.uint32), "pos": state[1][624]}}
+    words = np.empty(0, dtype=np.int64)
+    drawn = 0
+
+    start = 0
+    while True:
+        start = simulate(types, addresses, start, l1d_tags, l1d_valid, l1i_tags, l1i_valid, l1_geometry,
+                         tags, valid, dirty, stamps, l2_geometry, l2.lru, words, costs, counts, energy)
+        if start == len(types):
+            break
+        used = counts[WORD]
+        words = np.concatenate([words[used:], generator.random_raw(WORDS).astype(np.int64)])
+        drawn += used
+        counts[WORD] = 0
+    drawn += counts[WORD]
+
+    # leave the random module where randint would have left it
+    if drawn:
+        generator.state = {"bit_generator": "MT19937", "state": {"key": np.array(state[1][:624], dtype=np.uint32), "pos": state[1][624]}}
+        generator.random_raw(drawn)
+        after = generator.state["state"]
+        random.setstate((state[0], tuple(int(word) for word in after["key"]) + (int(after["pos"]),), state[2]))
+
+    sim.clock = float(energy[CLOCK])
+    l1d.accesses, l1d.misses = int(counts[L1D_ACCESSES]), int(counts[L1D_MISSES])
+    l1i.accesses, l1i.misses = int(counts[L1I_ACCESSES]), int(counts[L1I_MISSES])
+    l2.accesses, l2.misses = int(counts[L2_ACCESSES]), int(counts[L2_MISSES])
+    dram.accesses = int(counts[DRAM_ACCESSES])
+    l1d.total_active_energy = float(energy[L1D_ENERGY])
+    l1i.total_active_energy = float(energy[L1I_ENERGY])
+    l2.total_active_energy = float(energy[L2_ENERGY])
+    dram.total_active_energy = float(energy[DRAM_ENERGY])
+
+    for l1, l1_tags, l1_valid in ((l1d, l1d_tags, l1d_valid), (l1i, l1i_tags, l1i_valid)):
+        l1.tags = l1_tags.tolist()
+        l1.valid = [bool(v) for v in l1_valid]
+
+    # packed per-set rows, the layout L2Cache.densify uses, cut from one
+    # bytes object per table rather than from thousands of row views
+    l2.sparse = False
+    step = ways * array("l").itemsize
+    packed = tags.astype("l").tobytes()
+    l2.tags = [array("l", packed[i:i + step]) for i in range(0, len(packed), step)]
+    packed = valid.tobytes()
+    l2.valid = [bytearray(packed[i:i + ways]) for i in range(0, len(packed), ways)]
+    packed = dirty.tobytes()
+    l2.dirty = [bytearray(packed[i:i + ways]) for i in range(0, len(packed), ways)]
+    if l2.lru:
+        order = np.argsort(stamps, axis=1, kind="stable").tolist()
+        l2.recency = {set_index: OrderedDict.fromkeys(row) for set_index, row in enumerate(order)}
+    if isinstance(l2, FullyAssociativeL2Cache):
+        l2.where = {tag: way for way, tag in enumerate(l2.tags[0]) if l2.valid[0][way]}
+        l2.free = [-way for way in range(ways) if not l2.valid[0][way]]
+        heapq.heapify(l2.free)
+
+
+class FastSim:
+    """
+    Runs the CacheSim hierarchy with the access loop compiled by Numba over
+    flat NumPy arrays. Counters, clock, energy, final cache contents and the
+    state of the random module all come out exactly as the reference
+    classes leave them, so stats() and report() are CacheSim's own. Without
+    Numba, or for hierarchies the kernel does not model, the reference
+    simulator runs instead.
+    """
+    def __init__(self, filename: str, l2_assoc: int = 4, l2_capacity: int = 1 << 18, storage: str = "dense",
+                 config=None, limit: int = None):
+        if config is None:
+            config = default_config(l2_assoc, l2_capacity, storage)
+
+        self.filename = filename
+        self.limit = limit
+
+        # the kernel holds the L2 in its own arrays, so the reference L2 starts
+        # sparse rather than allocating every set only to be overwritten
+        sparse = copy.deepcopy(config)
+        sparse["levels"][0]["storage"] = "sparse"
+        self.simulator = CacheSim(None, config=sparse)
+        self.compiled = supported(self.simulator)
+        if not self.compiled:
+            self.simulator = CacheSim(None, config=config)
+        self.simulator.config = config
+        self.simulator.name = filename[len(TRACE_DIR):]
+
+    def run(self):
+        if not self.compiled:
+            line_access = self.simulator.line_access
+            for type_, address in stream_trace(self.filename, self.limit):
+                line_access(type_, address)
+            return self.stats()
+
+        types, addresses = load_trace(self.filename, self.limit)
+        self.run_arrays(types, addresses)
+        return self.stats()
+
+    def run_arrays(self, types, addresses):
+        """
+        Simulate accesses held in arrays, then copy the final state back
+        into the reference objects.
+        """
+        run_on(self.simulator, types, addresses)
+
+    def stats(self):
+        return self.simulator.stats()
+
+    def report(self):
+        self.simulator.report()
+
+    def total_time(self):
+        return self.simulator.total_time()
+
+    def total_energy(self):
+        return self.simulator.total_energy()
+
+
+def warm_up():
+    """
+    Load or compile the kernels, so timings measure simulation only.
+    """
+    if njit is not None:
+        # traces are parsed from read-only buffers
+        parse_din(np.frombuffer(b"0 0 0\n", dtype=np.uint8), HEX, np.empty(1, dtype=np.uint8), np.empty(1, dtype=np.uint32))
+        FastSim("", config=default_config()).run_arrays(np.zeros(1, dtype=np.uint8), np.zeros(1, dtype=np.uint32))
+
+
+def check(filename, config=None, limit=None, seed=0):
+    """
+    Run the reference simulator and the compiled engine from the same seed
+    and compare every reported stat, the clock and the random module's
+    state. Returns the mismatches and both run times.
+    """
+    warm_up()
+
+    random.seed(seed)
+    start = time.perf_counter()
+    reference = CacheSim(filename, config=config, limit=limit)
+    expected = reference.run().as_row()
+    after = random.getstate()
+    reference_time = time.perf_counter() - start
+    del reference
+
+    # time the compiled run end to end, parsing included
+    read_trace.cache_clear()
+    random.seed(seed)
+    start = time.perf_counter()
+    fast = FastSim(filename, config=config, limit=limit)
+    actual = fast.run().as_row()
+    fast_time = time.perf_counter() - start
+
+    mismatches = [(name, expected[name], actual[name]) for name in expected if expected[name] != actual[name]]
+    if random.getstate() != after:
+        mismatches.append(("random state", "", ""))
+    return mismatches, reference_time, fast_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache simulation with a JIT-compiled access loop.")
+    parser.add_argument("input_file", help="trace in ./Traces/Spec_Benchmark/ (.din or .dinb)")
+    parser.add_argument("--config", help="JSON hierarchy description")
+    parser.add_argument("--l2-assoc", type=int, default=4)
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--check", action="store_true", help="also run the reference simulator and compare every stat")
+    args = parser.parse_args()
+
+    filename = TRACE_DIR + args.input_file
+    config = load_config(args.config) if args.config else default_config(args.l2_assoc)
+
+    if args.check:
+        mismatches, reference_time, fast_time = check(filename, config, args.limit, args.seed or 0)
+        for name, expected, actual in mismatches:
+            print("Mismatch in {}: reference {}, compiled {}".format(name, expected, actual))
+        print("{} ({} mismatches)".format("OK" if not mismatches else "FAILED", len(mismatches)))
+        print("Reference: {:.3f} s  Compiled: {:.3f} s  Speedup: {:.1f}x".format(reference_time, fast_time, reference_time / fast_time))
+        return
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    simulator = FastSim(filename, config=config, limit=args.limit)
+    if not simulator.compiled:
+        print("Numba unavailable or hierarchy not supported by the kernel; using the reference simulator\n")
+    simulator.run()
+    simulator.report()
+
+
+if __name__ == "__main__":
+    main()
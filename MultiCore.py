@@ -0,0 +1,217 @@
+import argparse
+import heapq
+import random
+
+import CacheSimulator as sim
+from CacheSimulator import TRACE_DIR, L1Cache, build_levels, default_config, load_config, stream_trace
+
+
+class Core:
+    """
+    One core: a private L1 data/instruction pair driven by its own trace,
+    with its own clock and its share of the shared levels' traffic and
+    energy.
+    """
+    def __init__(self, index, filename, l2, config, limit=None):
+        self.index = index
+        self.name = filename.rsplit("/", 1)[-1]
+        self.trace = stream_trace(filename, limit)
+        self.done = False
+
+        self.l2 = l2
+        self.l1_data = L1Cache(l2, **config["l1"])
+        self.l1_instruction = L1Cache(l2, **config["l1"])
+
+        self.clock = 0
+        self.lines = 0
+
+        # attributed from the shared levels, one entry per level plus DRAM
+        self.shared_accesses = None
+        self.shared_misses = None
+        self.shared_energy = None
+
+    def read_access(self, address, data=True):
+        l1_cache = self.l1_data if data else self.l1_instruction
+        if l1_cache.read(address):
+            return
+        for cache in self.levels:
+            if cache.read(address):
+                return
+        self.dram.read(address)
+
+    def write_access(self, address):
+        # a write miss allocates at every shared level down to the first
+        # one holding the block, without a DRAM read
+        if self.l1_data.write(address):
+            return
+        for cache in self.levels:
+            if cache.write(address):
+                return
+
+    def l1_energy(self):
+        return self.l1_data.idle_energy() + self.l1_data.active_energy() + \
+            self.l1_instruction.idle_energy() + self.l1_instruction.active_energy()
+
+    def attributed_energy(self):
+        """
+        The core's own L1 energy plus its share of the shared levels' active
+        energy. Idle energy of shared levels is not attributed.
+        """
+        return self.l1_energy() + sum(self.shared_energy)
+
+
+class MultiCoreSim:
+    """
+    Several traces running against one shared L2 (and any levels below it)
+    and DRAM, each through its own private L1s. Traces are streamed, and a
+    scheduler decides which core issues next: "round-robin" takes `quantum`
+    lines from each core in turn, "time" always advances the core whose
+    clock is furthest behind.
+    """
+    def __init__(self, filenames, config=None, scheduler="round-robin", quantum=1, limit=None):
+        if scheduler not in ("round-robin", "time"):
+            raise ValueError("Unknown scheduler: {}".format(scheduler))
+
+        if config is None:
+            config = default_config()
+        self.config = config
+        self.scheduler = scheduler
+        self.quantum = quantum
+
+        sim.clock = 0
+
+        self.levels, self.dram = build_levels(config)
+        self.l2 = self.levels[0]
+
+        self.cores = [Core(i, filename, self.l2, config, limit) for i, filename in enumerate(filenames)]
+        for core in self.cores:
+            core.levels = self.levels
+            core.dram = self.dram
+            core.shared_accesses = [0] * (len(self.levels) + 1)
+            core.shared_misses = [0] * len(self.levels)
+            core.shared_energy = [0] * (len(self.levels) + 1)
+
+        # an eviction in the shared L2 back-invalidates every core's L1s
+        self.l2.set_uppers([l1 for core in self.cores for l1 in (core.l1_data, core.l1_instruction)])
+
+    def snapshot(self):
+        shared = self.levels + [self.dram]
+        return [level.accesses for level in shared], [level.misses for level in self.levels], \
+            [level.active_energy() for level in shared]
+
+    def step(self, core):
+        """
+        Issue the core's next trace line on its own clock. Returns False once
+        its trace is exhausted.
+        """
+        try:
+            type_, address = next(core.trace)
+        except StopIteration:
+            core.done = True
+            return False
+
+        sim.clock = core.clock
+        accesses = self.l2.accesses
+
+        if type_ == 0:
+            core.read_access(address, data=True)
+        elif type_ == 1:
+            core.write_access(address)
+        elif type_ == 2:
+            core.read_access(address, data=False)
+
+        core.clock = sim.clock
+        core.lines += 1
+
+        if self.l2.accesses != accesses:
+            # the line reached the shared levels, charge the difference to this core
+            after = self.snapshot()
+            for total, before, attributed in zip(after, self.before, (core.shared_accesses, core.shared_misses, core.shared_energy)):
+                for i in range(len(total)):
+                    attributed[i] += total[i] - before[i]
+            self.before = after
+        return True
+
+    def run(self):
+        self.before = self.snapshot()
+
+        if self.scheduler == "round-robin":
+            active = list(self.cores)
+            while active:
+                for core in active:
+                    for _ in range(self.quantum):
+                        if not self.step(core):
+                            break
+                active = [core for core in active if not core.done]
+        else:
+            ready = [(core.clock, core.index) for core in self.cores]
+            heapq.heapify(ready)
+            while ready:
+                _, index = heapq.heappop(ready)
+                core = self.cores[index]
+                if self.step(core):
+                    heapq.heappush(ready, (core.clock, index))
+
+        # idle energy accrues until the slowest core finishes
+        sim.clock = self.total_time()
+
+    def total_time(self):
+        return max(core.clock for core in self.cores)
+
+    def total_energy(self):
+        return sum(core.l1_energy() for core in self.cores) + \
+            sum(level.idle_energy() + level.active_energy() for level in self.levels) + \
+            self.dram.idle_energy() + self.dram.active_energy()
+
+    def report(self):
+        """
+        Output per-core L1 stats and attributed shared-level traffic and
+        energy, then the shared totals.
+        """
+        names = [level.name for level in self.levels]
+
+        print("Shared-{} Multi-Core Stats ({} cores, {} scheduling)\n".format(self.l2.name, len(self.cores), self.scheduler))
+
+        for core in self.cores:
+            print("Core {}: {} ({} lines, {:.10f} s)".format(core.index, core.name, core.lines, core.clock))
+            for name, l1 in (("L1 Data", core.l1_data), ("L1 Instruction", core.l1_instruction)):
+                print("  {} Hits: {}  Misses: {}".format(name, l1.get_hits(), l1.get_misses()))
+            for i, name in enumerate(names):
+                print("  {} Accesses: {}  Misses: {}  Active Consumption: {:.9f} J".format(
+                    name, core.shared_accesses[i], core.shared_misses[i], core.shared_energy[i]))
+            print("  DRAM Accesses: {}  Active Consumption: {:.9f} J".format(core.shared_accesses[-1], core.shared_energy[-1]))
+            print("  Attributed Energy: {:.9f} J\n".format(core.attributed_energy()))
+
+        for level in self.levels:
+            print("{} Hits: {}  Misses: {}".format(level.name, level.get_hits(), level.get_misses()))
+            print("Total Consumption from {}: {:.9f} J".format(level.name, level.idle_energy() + level.active_energy()))
+        print("DRAM Accesses:", self.dram.get_accesses())
+        print("Total Consumption from DRAM: {:.9f} J\n".format(self.dram.idle_energy() + self.dram.active_energy()))
+
+        print("Total Energy Consumption: {:.9f} J".format(self.total_energy()))
+        print("Total Time: {:.10f} s\n".format(self.total_time()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-core simulation with a shared L2.")
+    parser.add_argument("input_files", nargs="+", help="traces in ./Traces/Spec_Benchmark/, one per core")
+    parser.add_argument("--scheduler", choices=["round-robin", "time"], default="round-robin")
+    parser.add_argument("--quantum", type=int, default=1, help="lines per core per round-robin turn")
+    parser.add_argument("--config", help="JSON hierarchy description")
+    parser.add_argument("--limit", type=int, help="only simulate this many lines of each trace")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    config = load_config(args.config) if args.config else None
+    filenames = [TRACE_DIR + name for name in args.input_files]
+
+    simulator = MultiCoreSim(filenames, config, args.scheduler, args.quantum, args.limit)
+    simulator.run()
+    simulator.report()
+
+
+if __name__ == "__main__":
+    main()
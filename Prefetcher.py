@@ -0,0 +1,146 @@
+from collections import OrderedDict
+
+
+class Prefetcher:
+    """
+    Base prefetcher class. A prefetcher watches the demand stream seen by the
+    cache it is attached to and returns the addresses it wants brought in.
+    """
+    def __init__(self, block_size=64, degree=1):
+        self.block_size = block_size
+        self.block_bits = block_size.bit_length() - 1
+        self.degree = degree
+
+    def observe(self, address, miss):
+        """
+        Train on a demand access. `miss` is True for demand misses and for the
+        first demand hit on a prefetched block. Returns a list of block
+        addresses to prefetch.
+        """
+        raise NotImplementedError
+
+    def block_address(self, block):
+        return block << self.block_bits
+
+
+class NextLinePrefetcher(Prefetcher):
+    """
+    Tagged next-line prefetcher: on a miss (or first use of a prefetched
+    block), fetch the following `degree` blocks.
+    """
+    def observe(self, address, miss):
+        if not miss:
+            return []
+
+        block = address >> self.block_bits
+        return [self.block_address(block + i) for i in range(1, self.degree + 1)]
+
+
+class StridePrefetcher(Prefetcher):
+    """
+    Stride prefetcher. Dinero traces carry no PC, so the reference prediction
+    table is indexed by address region instead.
+    """
+    def __init__(self, block_size=64, degree=2, region_size=1 << 12, table_size=64, threshold=2):
+        super().__init__(block_size, degree)
+        self.region_bits = region_size.bit_length() - 1
+        self.table_size = table_size
+        self.threshold = threshold
+
+        # region -> [last block, stride, confidence]
+        self.table = OrderedDict()
+
+    def observe(self, address, miss):
+        block = address >> self.block_bits
+        region = address >> self.region_bits
+
+        entry = self.table.get(region)
+        if entry is None:
+            if len(self.table) >= self.table_size:
+                self.table.popitem(last=False)
+            self.table[region] = [block, 0, 0]
+            return []
+
+        self.table.move_to_end(region)
+        stride = block - entry[0]
+        if stride == 0:
+            return []
+
+        if stride == entry[1]:
+            entry[2] = min(entry[2] + 1, self.threshold + 1)
+        else:
+            entry[1] = stride
+            entry[2] = 0
+        entry[0] = block
+
+        if entry[2] < self.threshold:
+            return []
+
+        return [self.block_address(block + stride * i) for i in range(1, self.degree + 1)]
+
+
+class StreamPrefetcher(Prefetcher):
+    """
+    Stream prefetcher. Misses that fall within `window` blocks of a tracked
+    stream confirm its direction; confirmed streams run up to `distance`
+    blocks ahead of the demand stream, `degree` blocks per trigger.
+    """
+    def __init__(self, block_size=64, degree=2, distance=8, streams=16, window=16):
+        super().__init__(block_size, degree)
+        self.distance = distance
+        self.max_streams = streams
+        self.window = window
+
+        # stream id -> [last block, direction, confidence, frontier]
+        self.streams = OrderedDict()
+        self.next_id = 0
+
+    def observe(self, address, miss):
+        if not miss:
+            return []
+
+        block = address >> self.block_bits
+
+        for key, stream in self.streams.items():
+            delta = block - stream[0]
+            if delta == 0 or abs(delta) > self.window:
+                continue
+
+            direction = 1 if delta > 0 else -1
+            if stream[1] == 0:
+                # training: the second miss sets the direction
+                stream[1] = direction
+            elif stream[1] != direction:
+                continue
+
+            self.streams.move_to_end(key)
+            stream[0] = block
+            stream[2] += 1
+            if stream[2] < 2:
+                return []
+
+            # issue from the frontier, but never behind the demand stream
+            start = stream[3] if (stream[3] - block) * direction > 0 else block
+            limit = block + direction * self.distance
+
+            prefetches = []
+            current = start
+            while len(prefetches) < self.degree and (limit - current) * direction > 0:
+                current += direction
+                prefetches.append(self.block_address(current))
+            stream[3] = current
+            return prefetches
+
+        # no stream matched, start training a new one
+        if len(self.streams) >= self.max_streams:
+            self.streams.popitem(last=False)
+        self.streams[self.next_id] = [block, 0, 0, block]
+        self.next_id += 1
+        return []
+
+
+PREFETCHERS = {
+    "next-line": NextLinePrefetcher,
+    "stride": StridePrefetcher,
+    "stream": StreamPrefetcher,
+}
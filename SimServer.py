@@ -0,0 +1,313 @@
+import argparse
+import asyncio
+import json
+import os
+import pickle
+import random
+import socket
+import struct
+import sys
+from array import array
+
+import CacheSimulator as sim
+from CacheSimulator import TRACE_DIR, CacheSim, load_config, stream_trace
+from FastSim import run_on, supported
+from Prefetcher import PREFETCHERS
+
+"""
+Wire protocol. Every message is a one-byte kind and a little-endian uint32
+payload length, then the payload:
+
+  A  access batch: n type bytes followed by n little-endian uint32
+     addresses (columnar, so the server decodes a batch without a loop)
+  S  stats query: empty payload
+  P  snapshot: payload is a path; the simulator is pickled there
+  X  shutdown: empty payload
+
+Access batches get no reply. Every other message gets a uint32 length and
+a JSON reply, and since one connection is served in order, a stats query
+also acts as a barrier for the batches sent before it.
+"""
+
+HEADER = struct.Struct("<cI")
+REPLY = struct.Struct("<I")
+
+ACCESS = b"A"
+STATS = b"S"
+SNAPSHOT = b"P"
+SHUTDOWN = b"X"
+
+# accesses per batch sent by the client
+BATCH = 1 << 16
+
+# smallest batch handed to the compiled kernel; below this, copying the
+# hierarchy in and out of its arrays costs more than the reference loop
+COMPILED_BATCH = 1 << 12
+
+
+def decode_batch(payload):
+    """
+    Split an access batch into its types and addresses.
+    """
+    n = len(payload) // 5
+    addresses = array("I")
+    addresses.frombytes(payload[n:])
+    if sys.byteorder == "big":
+        addresses.byteswap()
+    return payload[:n], addresses
+
+
+def decode_arrays(payload):
+    """
+    Split an access batch into numpy arrays of types and addresses, as the
+    compiled kernel takes them.
+    """
+    import numpy as np
+
+    n = len(payload) // 5
+    return np.frombuffer(payload, np.uint8, count=n), np.frombuffer(payload, "<u4", offset=n).astype(np.uint32)
+
+
+def encode_batch(types, addresses):
+    """
+    Pack an access batch. Accepts sequences of ints or numpy arrays.
+    """
+    if hasattr(addresses, "astype"):
+        return bytes(types.astype("u1")) + addresses.astype("<u4").tobytes()
+
+    words = array("I", addresses)
+    if sys.byteorder == "big":
+        words.byteswap()
+    return bytes(types) + words.tobytes()
+
+
+def load_snapshot(path):
+    """
+    Restore a simulator pickled by a snapshot request, clock included.
+    """
+    with open(path, "rb") as f:
+        state = pickle.load(f)
+    sim.clock = state["clock"]
+    random.setstate(state["random"])
+    return state["simulator"]
+
+
+class SimServer:
+    """
+    Serves one CacheSim to any number of local producers. Batches from all
+    connections are applied to the same simulator in arrival order; large
+    ones run in FastSim's compiled kernel when it models the hierarchy,
+    which leaves the simulator exactly as access_many would.
+    """
+    def __init__(self, simulator):
+        self.simulator = simulator
+        self.compiled = supported(simulator)
+        self.accesses = 0
+        self.batches = 0
+        self.done = None
+
+    def stats(self):
+        row = self.simulator.stats().as_row()
+        row["Accesses Received"] = self.accesses
+        row["Batches Received"] = self.batches
+        return row
+
+    def snapshot(self, path):
+        state = {"simulator": self.simulator, "clock": sim.clock, "random": random.getstate()}
+        with open(path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return {"path": path, "accesses": self.accesses}
+
+    def handle(self, kind, payload):
+        """
+        Apply one message. Returns the reply, or None for access batches.
+        """
+        if kind == ACCESS:
+            if self.compiled and len(payload) >= 5 * COMPILED_BATCH:
+                types, addresses = decode_arrays(payload)
+                run_on(self.simulator, types, addresses)
+            else:
+                types, addresses = decode_batch(payload)
+                self.simulator.access_many(types, addresses)
+            self.accesses += len(types)
+            self.batches += 1
+            return None
+        if kind == STATS:
+            return self.stats()
+        if kind == SNAPSHOT:
+            return self.snapshot(payload.decode())
+        if kind == SHUTDOWN:
+            self.done.set()
+            return {"accesses": self.accesses}
+        return {"error": "unknown message kind {!r}".format(kind)}
+
+    async def serve_stream(self, reader, writer):
+        try:
+            while True:
+                try:
+                    kind, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+                    payload = await reader.readexactly(length)
+                except asyncio.IncompleteReadError:
+                    return
+
+                reply = self.handle(kind, payload)
+                if reply is not None:
+                    data = json.dumps(reply).encode()
+                    writer.write(REPLY.pack(len(data)) + data)
+                    await writer.drain()
+        except asyncio.CancelledError:
+            # the server is shutting down under a producer still connected
+            return
+        finally:
+            writer.close()
+
+    async def serve_unix(self, path):
+        self.done = asyncio.Event()
+        server = await asyncio.start_unix_server(self.serve_stream, path)
+        try:
+            async with server:
+                await self.done.wait()
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    async def serve_pipe(self):
+        """
+        Read messages from stdin and write replies to stdout, for a producer
+        that spawns the server as a child process.
+        """
+        self.done = asyncio.Event()
+        loop = asyncio.get_running_loop()
+
+        reader = asyncio.StreamReader(limit=1 << 24)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin.buffer)
+        transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, sys.stdout.buffer)
+        writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+
+        serving = asyncio.ensure_future(self.serve_stream(reader, writer))
+        stopping = asyncio.ensure_future(self.done.wait())
+        await asyncio.wait([serving, stopping], return_when=asyncio.FIRST_COMPLETED)
+
+
+class SimClient:
+    """
+    Blocking client for producers. Accesses are buffered and sent in
+    batches of `batch`; queries flush the buffer first.
+    """
+    def __init__(self, path, batch=BATCH):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+        self.batch = batch
+        self.types = bytearray()
+        self.addresses = array("I")
+
+    def access(self, type_, address):
+        self.types.append(type_)
+        self.addresses.append(address)
+        if len(self.types) >= self.batch:
+            self.flush()
+
+    def access_many(self, types, addresses):
+        """
+        Send a whole batch at once, bypassing the buffer.
+        """
+        self.flush()
+        self.send(ACCESS, encode_batch(types, addresses))
+
+    def flush(self):
+        if self.types:
+            self.send(ACCESS, encode_batch(self.types, self.addresses))
+            self.types = bytearray()
+            self.addresses = array("I")
+
+    def send(self, kind, payload=b""):
+        self.socket.sendall(HEADER.pack(kind, len(payload)) + payload)
+
+    def request(self, kind, payload=b""):
+        self.flush()
+        self.send(kind, payload)
+        length, = REPLY.unpack(self.receive(REPLY.size))
+        return json.loads(self.receive(length))
+
+    def receive(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.socket.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("Server closed the connection")
+            data += chunk
+        return bytes(data)
+
+    def stats(self):
+        return self.request(STATS)
+
+    def snapshot(self, path):
+        return self.request(SNAPSHOT, path.encode())
+
+    def shutdown(self):
+        return self.request(SHUTDOWN)
+
+    def close(self):
+        self.flush()
+        self.socket.close()
+
+
+def replay(path, filename, batch=BATCH, limit=None):
+    """
+    Stream a trace file to a running server and return its stats.
+    """
+    client = SimClient(path, batch)
+    for type_, address in stream_trace(filename, limit):
+        client.access(type_, address)
+    stats = client.stats()
+    client.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Live cache simulation service.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="run a simulator fed over a Unix socket or stdin")
+    serve.add_argument("--socket", default="cachesim.sock", help="Unix socket path")
+    serve.add_argument("--pipe", action="store_true", help="read messages from stdin and reply on stdout")
+    serve.add_argument("--config", help="JSON hierarchy description")
+    serve.add_argument("--l2-assoc", type=int, default=4)
+    serve.add_argument("--prefetch", choices=sorted(PREFETCHERS))
+    serve.add_argument("--victim", type=int, default=0, metavar="ENTRIES")
+    serve.add_argument("--restore", help="resume from a snapshot instead of an empty hierarchy")
+    serve.add_argument("--seed", type=int)
+
+    client = commands.add_parser("replay", help="stream a trace to a running server")
+    client.add_argument("input_file", help="trace in ./Traces/Spec_Benchmark/")
+    client.add_argument("--socket", default="cachesim.sock")
+    client.add_argument("--batch", type=int, default=BATCH)
+    client.add_argument("--limit", type=int)
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        stats = replay(args.socket, TRACE_DIR + args.input_file, args.batch, args.limit)
+        for name, value in stats.items():
+            print("{}: {}".format(name, value))
+        return
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    if args.restore:
+        simulator = load_snapshot(args.restore)
+    else:
+        config = load_config(args.config) if args.config else None
+        prefetcher = PREFETCHERS[args.prefetch]() if args.prefetch else None
+        simulator = CacheSim(None, args.l2_assoc, prefetcher, victim_entries=args.victim, config=config)
+
+    server = SimServer(simulator)
+    if args.pipe:
+        asyncio.run(server.serve_pipe())
+    else:
+        print("Serving on {}".format(args.socket), file=sys.stderr)
+        asyncio.run(server.serve_unix(args.socket))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+import csv
+import json
+import numbers
+
+
+class LevelStats:
+    """
+    Counters and energy of one memory level after a run.
+    """
+    __slots__ = ("name", "accesses", "hits", "misses", "idle_energy", "active_energy")
+
+    def __init__(self, name: str, accesses: int = 0, hits: int = 0, misses: int = 0,
+                 idle_energy: float = 0.0, active_energy: float = 0.0):
+        self.name = name
+        self.accesses = accesses
+        self.hits = hits
+        self.misses = misses
+        self.idle_energy = idle_energy
+        self.active_energy = active_energy
+
+    @classmethod
+    def of(cls, name, level):
+        """
+        Read the stats of a cache, or of DRAM, which serves every access.
+        """
+        idle_energy, active_energy = float(level.idle_energy()), float(level.active_energy())
+        if hasattr(level, "get_misses"):
+            return cls(name, level.get_accesses(), level.get_hits(), level.get_misses(), idle_energy, active_energy)
+        return cls(name, level.get_accesses(), level.get_accesses(), 0, idle_energy, active_energy)
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.accesses if self.accesses > 0 else 0.0
+
+    @property
+    def energy(self):
+        return self.idle_energy + self.active_energy
+
+    def add(self, other):
+        self.accesses += other.accesses
+        self.hits += other.hits
+        self.misses += other.misses
+        self.idle_energy += other.idle_energy
+        self.active_energy += other.active_energy
+
+    def __repr__(self):
+        return "LevelStats({})".format(", ".join("{}={!r}".format(slot, getattr(self, slot)) for slot in self.__slots__))
+
+
+class SimStats:
+    """
+    The result of one simulation: per-level stats from L1 down to DRAM, plus
+    run totals. Stats of repeated runs can be accumulated with add().
+    """
+    __slots__ = ("trace", "levels", "total_time", "total_energy", "runs")
+
+    def __init__(self, trace: str, levels: list, total_time: float = 0.0, total_energy: float = 0.0, runs: int = 1):
+        self.trace = trace
+        self.levels = levels
+        self.total_time = total_time
+        self.total_energy = total_energy
+        self.runs = runs
+
+    @classmethod
+    def of(cls, simulator):
+        levels = [LevelStats.of("L1 Data", simulator.l1_data), LevelStats.of("L1 Instruction", simulator.l1_instruction)]
+        levels += [LevelStats.of(cache.name, cache) for cache in simulator.levels]
+        levels.append(LevelStats.of("DRAM", simulator.dram))
+        return cls(simulator.name, levels, float(simulator.total_time()), float(simulator.total_energy()))
+
+    @property
+    def caches(self):
+        return self.levels[:-1]
+
+    @property
+    def dram(self):
+        return self.levels[-1]
+
+    def level(self, name):
+        for level in self.levels:
+            if level.name == name:
+                return level
+        raise KeyError(name)
+
+    def add(self, other):
+        for level, other_level in zip(self.levels, other.levels):
+            level.add(other_level)
+        self.total_time += other.total_time
+        self.total_energy += other.total_energy
+        self.runs += other.runs
+
+    def as_dict(self):
+        """
+        A JSON-serializable form of the record; see from_dict.
+        """
+        return {
+            "trace": self.trace,
+            "levels": [[getattr(level, slot) for slot in LevelStats.__slots__] for level in self.levels],
+            "total_time": self.total_time,
+            "total_energy": self.total_energy,
+            "runs": self.runs,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["trace"], [LevelStats(*level) for level in data["levels"]],
+                   data["total_time"], data["total_energy"], data["runs"])
+
+    def as_row(self, labels=None):
+        """
+        Flatten into one results row. `labels` maps level names to column
+        prefixes (e.g. "L1 Data" to "L1d"); DRAM has no miss columns.
+        """
+        labels = labels or {}
+        row = {"Trace": self.trace, "Runs": self.runs, "Total Time (s)": self.total_time, "Total Energy (J)": self.total_energy}
+        for level in self.levels:
+            prefix = labels.get(level.name, level.name)
+            row[prefix + " Accesses"] = level.accesses
+            if level is not self.dram:
+                row[prefix + " Misses"] = level.misses
+                row[prefix + " Hit Rate"] = level.hit_rate
+            row[prefix + " Idle Consumption (J)"] = level.idle_energy
+            row[prefix + " Active Consumption (J)"] = level.active_energy
+            row[prefix + " Energy (J)"] = level.energy
+        return row
+
+
+"""
+Results writers. Each takes one row (a flat dict) at a time and streams it
+to disk; numpy, pyarrow and pandas are only imported by the formats that
+need them.
+"""
+
+class ResultWriter:
+    """
+    Base writer. The columns are fixed by the first row written.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.columns = None
+        self.rows = 0
+
+    def write(self, row):
+        if self.columns is None:
+            self.columns = list(row)
+            self.start()
+        self.write_row(row)
+        self.rows += 1
+
+    def write_all(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def start(self):
+        pass
+
+    def write_row(self, row):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CSVWriter(ResultWriter):
+    def __init__(self, path):
+        super().__init__(path)
+        self.file = open(path, "w", newline="")
+
+    def start(self):
+        self.writer = csv.DictWriter(self.file, self.columns)
+        self.writer.writeheader()
+
+    def write_row(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+
+class JSONLinesWriter(ResultWriter):
+    def __init__(self, path):
+        super().__init__(path)
+        self.file = open(path, "w")
+
+    def write_row(self, row):
+        self.file.write(json.dumps(row) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class ColumnarWriter(ResultWriter):
+    """
+    Buffers rows column by column and flushes them every `chunk` rows, so
+    memory stays bounded however long the sweep runs.
+    """
+    def __init__(self, path, chunk=1024):
+        super().__init__(path)
+        self.chunk = chunk
+        self.buffer = None
+
+    def start(self):
+        self.buffer = {column: [] for column in self.columns}
+
+    def write_row(self, row):
+        for column in self.columns:
+            self.buffer[column].append(row[column])
+        if len(self.buffer[self.columns[0]]) >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        if self.buffer and self.buffer[self.columns[0]]:
+            self.write_chunk(self.buffer)
+            self.start()
+
+    def write_chunk(self, columns):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+
+class NPYWriter(ColumnarWriter):
+    """
+    Writes a structured .npy array, one field per column, appending each
+    chunk and patching the row count into the header on close. Strings are
+    stored as fixed-width unicode of `string_width` characters.
+    """
+    # room for any row count in the header, so it can be rewritten in place
+    SHAPE_WIDTH = 20
+
+    def __init__(self, path, chunk=1024, string_width=64):
+        super().__init__(path, chunk)
+        self.string_width = string_width
+        self.dtype = None
+        self.count = 0
+        self.file = open(path, "wb")
+
+    def header(self, count):
+        import numpy as np
+
+        header = "{{'descr': {!r}, 'fortran_order': False, 'shape': ({:>{}},), }}".format(
+            np.lib.format.dtype_to_descr(self.dtype), count, self.SHAPE_WIDTH)
+        # magic (6) + version (2) + length (2) + header + newline, padded to 64 bytes
+        padding = -(10 + len(header) + 1) % 64
+        header += " " * padding + "\n"
+        return b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header.encode("latin1")
+
+    def field(self, values):
+        """
+        Field type of a column, from every value in the first chunk: a
+        numeric column is only stored as integers if all of them are, since
+        e.g. an unused level reports an int 0 where others report floats.
+        """
+        if isinstance(values[0], str):
+            return "U{}".format(self.string_width)
+        if all(isinstance(value, bool) for value in values):
+            return "?"
+        if all(isinstance(value, numbers.Integral) for value in values):
+            return "<i8"
+        return "<f8"
+
+    def write_chunk(self, columns):
+        import numpy as np
+
+        if self.dtype is None:
+            self.dtype = np.dtype([(name, self.field(values)) for name, values in columns.items()])
+            self.file.write(self.header(0))
+
+        records = np.empty(len(columns[self.columns[0]]), dtype=self.dtype)
+        for name, values in columns.items():
+            if self.dtype[name].kind == "U" and max(len(value) for value in values) > self.string_width:
+                raise ValueError("Value of {} is longer than {} characters".format(name, self.string_width))
+            if self.dtype[name].kind == "i" and not all(isinstance(value, numbers.Integral) for value in values):
+                raise ValueError("Column {} was stored as integers but got a non-integer value".format(name))
+            records[name] = values
+        self.file.write(records.tobytes())
+        self.count += len(records)
+
+    def close(self):
+        self.flush()
+        if self.dtype is not None:
+            self.file.seek(0)
+            self.file.write(self.header(self.count))
+        self.file.close()
+
+
+class ParquetWriter(ColumnarWriter):
+    """
+    Writes a Parquet file with one row group per chunk. Requires pyarrow.
+    """
+    def __init__(self, path, chunk=1024):
+        super().__init__(path, chunk)
+        self.writer = None
+
+    def write_chunk(self, columns):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.table(columns)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+
+
+WRITERS = {
+    ".csv": CSVWriter,
+    ".jsonl": JSONLinesWriter,
+    ".npy": NPYWriter,
+    ".parquet": ParquetWriter,
+}
+
+
+def open_writer(path, **kwargs):
+    """
+    Pick a results writer from the file extension.
+    """
+    for extension, writer in WRITERS.items():
+        if path.endswith(extension):
+            return writer(path, **kwargs)
+    raise ValueError("Unknown results format: {}".format(path))
+
+
+def read_results(path):
+    """
+    Load a results file written by one of the writers as a pandas DataFrame.
+    """
+    import pandas as pd
+
+    if path.endswith(".csv"):
+        return pd.read_csv(path)
+    if path.endswith(".jsonl"):
+        return pd.read_json(path, lines=True)
+    if path.endswith(".npy"):
+        import numpy as np
+        return pd.DataFrame(np.load(path))
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    raise ValueError("Unknown results format: {}".format(path))
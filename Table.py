@@ -1,94 +1,78 @@
-import pandas as pd
-from CacheSimulator import CacheSim
-
-def run_sims(filename, associativity):
-    total_time = 0.0
-    total_energy = 0.0
-    
-    l1i_accesses = 0.0
-    l1i_misses = 0.0
-    l1i_hit_rate = 0.0
-    l1i_idle_energy = 0.0
-    l1i_active_energy = 0.0
-    l1i_energy = 0.0
-    
-    l1d_accesses = 0.0
-    l1d_misses = 0.0
-    l1d_hit_rate = 0.0
-    l1d_idle_energy = 0.0
-    l1d_active_energy = 0.0
-    l1d_energy = 0.0
-    
-    l2_accesses = 0.0
-    l2_misses = 0.0
-    l2_hit_rate = 0.0
-    l2_idle_energy = 0.0
-    l2_active_energy = 0.0
-    l2_energy = 0.0
-    
-    dram_accesses = 0.0
-    dram_idle_energy = 0.0
-    dram_active_energy = 0.0
-    dram_energy = 0.0
-    
-    # Run the simulation
-    for _ in range(10):
-        simulator = CacheSim("./Traces/Spec_Benchmark/" + filename, associativity)
-        simulator.run()
-        
-        total_time += simulator.total_time()
-        total_energy += simulator.total_energy()
-        l1i_accesses += simulator.l1_instruction.get_accesses()
-        l1i_misses += simulator.l1_instruction.get_misses()
-        l1i_idle_energy += simulator.l1_instruction.idle_energy()
-        l1i_active_energy += simulator.l1_instruction.active_energy()
-        l1i_energy += simulator.l1_instruction.active_energy() + simulator.l1_instruction.idle_energy()
-        l1d_accesses += simulator.l1_data.get_accesses()
-        l1d_misses += simulator.l1_data.get_misses()
-        l1d_idle_energy += simulator.l1_instruction.idle_energy()
-        l1d_active_energy += simulator.l1_instruction.active_energy()
-        l1d_energy += simulator.l1_data.active_energy() + simulator.l1_data.idle_energy()
-        l2_accesses += simulator.l2.get_accesses()
-        l2_misses += simulator.l2.get_misses()
-        l2_idle_energy += simulator.l2.idle_energy()
-        l2_active_energy += simulator.l2.active_energy()
-        l2_energy += simulator.l2.active_energy() + simulator.l2.idle_energy()
-        dram_accesses += simulator.dram.get_accesses()
-        dram_idle_energy += simulator.dram.idle_energy()
-        dram_active_energy += simulator.dram.active_energy()
-        dram_energy += simulator.dram.active_energy() + simulator.dram.idle_energy()
-    
-    # Compute averages
-    l1i_hit_rate = ((l1i_accesses - l1i_misses) / l1i_accesses) if l1i_accesses > 0 else 0
-    l1d_hit_rate = ((l1d_accesses - l1d_misses) / l1d_accesses) if l1d_accesses > 0 else 0
-    l2_hit_rate = ((l2_accesses - l2_misses) / l2_accesses) if l2_accesses > 0 else 0
-    
-    l1i_mean_energy = l1i_energy / 10
-    l1d_mean_energy = l1d_energy / 10
-    l2_mean_energy = l2_energy / 10
-    dram_mean_energy = dram_energy / 10
-
-    mean_time = total_time / 10
-    mean_energy = total_energy / 10
-    
-    # Append results to the DataFrame
+import argparse
+import os
+from multiprocessing import Process
+
+import WorkQueue
+from CacheSimulator import TRACE_DIR, default_config
+from FastSim import FastSim
+from Stats import open_writer
+
+RUNS = 10
+
+# column prefix of each level in the results table
+LABELS = [("L1 Instruction", "L1i"), ("L1 Data", "L1d"), ("L2", "L2"), ("DRAM", "DRAM")]
+
+def run_sims(filename, associativity, runs=RUNS):
+    """
+    Simulate a trace `runs` times and sum the stats of every run. FastSim
+    gives the reference simulator's exact results, compiled when Numba is
+    installed.
+    """
+    total = None
+    for _ in range(runs):
+        simulator = FastSim(TRACE_DIR + filename, associativity)
+        stats = simulator.run()
+
+        if total is None:
+            total = stats
+        else:
+            total.add(stats)
+
+    return total
+
+def make_row(filename, associativity, total):
+    """
+    One row of the results table: totals over all runs, hit rates over all
+    accesses, and mean energies per run.
+    """
     row = {
         "File Name": filename,
         "Set Associativity": associativity,
-        "Total Access Time (s)": total_time,
-        "Mean Time (s)": mean_time,
-        "Total Energy (J)": total_energy,
-        "Mean Energy (J)": mean_energy,
-        "L1i Accesses": l1i_accesses, "L1i Misses": l1i_misses, "L1i Hit Rate": l1i_hit_rate,
-        "L1i Idle Consumption (J)": l1i_idle_energy, "L1i Active Consumption (J)": l1i_active_energy, "L1i Energy (J)": l1i_energy, "L1i Mean Energy (J)": l1i_mean_energy,
-        "L1d Accesses": l1d_accesses, "L1d Misses": l1d_misses, "L1d Hit Rate": l1d_hit_rate,
-        "L1d Idle Consumption (J)": l1d_idle_energy, "L1d Active Consumption (J)": l1d_active_energy, "L1d Energy (J)": l1d_energy, "L1d Mean Energy (J)": l1d_mean_energy,
-        "L2 Accesses": l2_accesses, "L2 Misses": l2_misses, "L2 Hit Rate": l2_hit_rate,
-        "L2 Idle Consumption (J)": l2_idle_energy, "L2 Active Consumption (J)": l2_active_energy, "L2 Energy (J)": l2_energy, "L2 Mean Energy (J)": l2_mean_energy,
-        "DRAM Accesses": dram_accesses, "DRAM Idle Consumption (J)": dram_idle_energy, "DRAM Active Consumption (J)": dram_active_energy, "DRAM Energy (J)": dram_energy, "DRAM Mean Energy (J)": dram_mean_energy
+        "Total Access Time (s)": total.total_time,
+        "Mean Time (s)": total.total_time / total.runs,
+        "Total Energy (J)": total.total_energy,
+        "Mean Energy (J)": total.total_energy / total.runs,
     }
-    
-    return pd.DataFrame([row])
+
+    for name, prefix in LABELS:
+        level = total.level(name)
+        row[prefix + " Accesses"] = level.accesses
+        if name != "DRAM":
+            row[prefix + " Misses"] = level.misses
+            row[prefix + " Hit Rate"] = level.hit_rate
+        row[prefix + " Idle Consumption (J)"] = level.idle_energy
+        row[prefix + " Active Consumption (J)"] = level.active_energy
+        row[prefix + " Energy (J)"] = level.energy
+        row[prefix + " Mean Energy (J)"] = level.energy / total.runs
+
+    return row
+
+def sweep_cells(files, associativities, runs=RUNS):
+    """
+    One work-queue cell per trace, associativity and run, each run with
+    its own seed.
+    """
+    return [(TRACE_DIR + file, default_config(num), seed, {"Set Associativity": num})
+            for file in files for num in associativities for seed in range(runs)]
+
+def write_merged(directory, output):
+    groups, missing = WorkQueue.merge(directory)
+    with open_writer(output) as writer:
+        for trace, label, total in groups:
+            writer.write(make_row(os.path.basename(trace), label["Set Associativity"], total))
+    if missing:
+        print("{} cells have no result (failed or unfinished); their rows are partial or absent".format(len(missing)))
+    print("Merged {} rows into {}".format(len(groups), output))
 
 def main():
     files=[
@@ -108,22 +92,47 @@ def main():
         "093.nasa7.din",
         "094.fpppp.din"
     ]
-    
+
     associativities = [2, 4, 8]
-    
-    results = []
-
-    for file in files:
-        for num in associativities:
-            print("Running simulation for {} with set associativity {}".format(file, num))
-            row = run_sims(file, num)
-            results.append(row)
-
-    df = pd.concat(results, ignore_index=True)
-    
-    df.to_csv("simulation_results.csv", index=False)
-    
-    print("All files processed!")
-    
+
+    parser = argparse.ArgumentParser(description="Sweep every trace over L2 associativities.")
+    parser.add_argument("--queue", metavar="DIR", help="distribute the sweep through a work queue in this shared directory")
+    parser.add_argument("--submit", action="store_true", help="write the sweep's cells into the queue")
+    parser.add_argument("--work", action="store_true", help="claim and run cells until the queue is drained")
+    parser.add_argument("--merge", action="store_true", help="merge the queue's result shards into the table")
+    parser.add_argument("--local", type=int, default=0, metavar="N", help="submit, drain with N local worker processes, then merge")
+    parser.add_argument("--lease", type=float, default=WorkQueue.LEASE, help="seconds before a claimed cell may be retried")
+    parser.add_argument("--output", default="simulation_results.csv")
+    args = parser.parse_args()
+
+    if args.queue is None:
+        # rows are streamed out as each cell finishes
+        with open_writer(args.output) as writer:
+            for file in files:
+                for num in associativities:
+                    print("Running simulation for {} with set associativity {}".format(file, num))
+                    writer.write(make_row(file, num, run_sims(file, num)))
+
+        print("All files processed!")
+        return
+
+    if args.submit or args.local:
+        count = WorkQueue.submit(args.queue, sweep_cells(files, associativities))
+        print("Submitted {} cells to {}".format(count, args.queue))
+
+    if args.local:
+        workers = [Process(target=WorkQueue.work, args=(args.queue, None, args.lease)) for _ in range(args.local)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    elif args.work:
+        done = WorkQueue.work(args.queue, lease=args.lease)
+        print("Completed {} cells".format(done))
+
+    if args.merge or args.local:
+        print("Queue status:", WorkQueue.status(args.queue))
+        write_merged(args.queue, args.output)
+
 if __name__ == "__main__":
     main()
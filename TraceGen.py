@@ -0,0 +1,253 @@
+import argparse
+
+import numpy as np
+
+# binary trace records: access type and 32-bit address, little-endian, packed
+# (the layout CacheSimulator.stream_trace reads)
+BINARY_RECORD = np.dtype([("type", "u1"), ("address", "<u4")])
+
+# records generated per vectorized chunk
+CHUNK = 1 << 20
+
+HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+SHIFTS = np.arange(28, -1, -4, dtype=np.uint32)
+
+
+class Pattern:
+    """
+    Base address pattern. Patterns are stateful so a trace can be generated
+    chunk by chunk and still continue where the previous chunk left off.
+    """
+    def generate(self, rng, n):
+        """
+        Return the next n addresses as a uint32 array.
+        """
+        raise NotImplementedError
+
+
+class Sequential(Pattern):
+    """
+    A stream walking a region word by word, wrapping at its end. With a
+    footprint larger than the cache, every block misses once: the hit rate
+    is 1 - stride / block_size.
+    """
+    def __init__(self, base=0x10000000, size=1 << 24, stride=4):
+        self.base = base
+        self.size = size
+        self.stride = stride
+        self.position = 0
+
+    def generate(self, rng, n):
+        offsets = (self.position + np.arange(n, dtype=np.uint64)) * self.stride % self.size
+        self.position += n
+        return (self.base + offsets).astype(np.uint32)
+
+    def expected_hit_rate(self, block_size, capacity):
+        if self.size <= capacity:
+            return 1.0
+        return max(0.0, 1 - self.stride / block_size)
+
+
+class Strided(Sequential):
+    """
+    Array traversal with a fixed stride, e.g. walking a column of a row-major
+    matrix. A stride of at least one block never hits once the array is
+    larger than the cache.
+    """
+    def __init__(self, base=0x20000000, size=1 << 22, stride=256):
+        super().__init__(base, size, stride)
+
+
+class PointerChase(Pattern):
+    """
+    Linked-list traversal: nodes are visited in the order of one random
+    cyclic permutation, so consecutive accesses have no spatial locality.
+    """
+    def __init__(self, base=0x30000000, nodes=1 << 16, node_size=64, rng=None):
+        self.base = base
+        self.nodes = nodes
+        self.node_size = node_size
+        self.order = (rng or np.random.default_rng()).permutation(nodes).astype(np.uint64)
+        self.position = 0
+
+    def generate(self, rng, n):
+        steps = (self.position + np.arange(n, dtype=np.uint64)) % self.nodes
+        self.position += n
+        return (self.base + self.order[steps] * self.node_size).astype(np.uint32)
+
+    def expected_hit_rate(self, block_size, capacity):
+        # every node is touched once per lap; all laps after the first hit if the list fits
+        return 1.0 if self.nodes * self.node_size <= capacity else 0.0
+
+
+class Zipf(Pattern):
+    """
+    Accesses to a hot set of blocks whose popularity follows a Zipf law
+    with exponent `alpha`. Ranks are scattered over the region so hot blocks
+    do not share sets by construction.
+    """
+    def __init__(self, base=0x40000000, blocks=1 << 16, block_size=64, alpha=1.0, rng=None):
+        rng = rng or np.random.default_rng()
+        self.base = base
+        self.block_size = block_size
+
+        weights = 1.0 / np.arange(1, blocks + 1) ** alpha
+        self.cdf = np.cumsum(weights / weights.sum())
+        self.blocks = rng.permutation(blocks).astype(np.uint64)
+
+    def generate(self, rng, n):
+        ranks = np.minimum(np.searchsorted(self.cdf, rng.random(n)), len(self.blocks) - 1)
+        words = rng.integers(0, self.block_size // 4, n, dtype=np.uint64)
+        return (self.base + self.blocks[ranks] * self.block_size + words * 4).astype(np.uint32)
+
+    def expected_hit_rate(self, block_size, capacity):
+        """
+        Steady-state hit rate of a direct-mapped cache. Accesses are
+        independent, so one to a block hits exactly when the previous
+        access to its set was to the same block: a set whose blocks are
+        drawn with probabilities p_i contributes sum(p_i^2) / sum(p_i).
+        Back-invalidations from an L2 too small for the hot set can pull
+        the simulated L1 slightly below this.
+        """
+        probabilities = np.diff(self.cdf, prepend=0.0)
+
+        # split or merge pattern blocks into cache blocks of block_size
+        parts = max(1, self.block_size // block_size)
+        step = self.block_size // parts
+        addresses = self.base + self.blocks[:, None] * self.block_size + np.arange(parts, dtype=np.uint64) * step
+        cache_blocks, inverse = np.unique(addresses.ravel() // block_size, return_inverse=True)
+        shares = np.bincount(inverse, weights=np.repeat(probabilities / parts, parts))
+
+        sets = (cache_blocks % (capacity // block_size)).astype(np.int64)
+        totals = np.bincount(sets, weights=shares)
+        squares = np.bincount(sets, weights=shares ** 2)
+        used = totals > 0
+        return float((squares[used] / totals[used]).sum())
+
+
+class Mix(Pattern):
+    """
+    Interleaves several patterns, drawing each access from one of them with
+    the given weights. Every component keeps its own position.
+    """
+    def __init__(self, patterns, weights=None):
+        self.patterns = patterns
+        weights = np.ones(len(patterns)) if weights is None else np.asarray(weights, dtype=float)
+        self.weights = weights / weights.sum()
+
+    def generate(self, rng, n):
+        choice = rng.choice(len(self.patterns), n, p=self.weights)
+        addresses = np.empty(n, dtype=np.uint32)
+        for i, pattern in enumerate(self.patterns):
+            mask = choice == i
+            count = int(mask.sum())
+            if count:
+                addresses[mask] = pattern.generate(rng, count)
+        return addresses
+
+
+def make_pattern(name, rng):
+    if name == "sequential":
+        return Sequential()
+    if name == "strided":
+        return Strided()
+    if name == "chase":
+        return PointerChase(rng=rng)
+    if name == "zipf":
+        return Zipf(rng=rng)
+    if name == "mix":
+        return Mix([Sequential(), Strided(), PointerChase(rng=rng), Zipf(rng=rng)])
+    raise ValueError("Unknown pattern: {}".format(name))
+
+
+def generate(pattern, n, ratio=(0.6, 0.2, 0.2), code=None, seed=0, chunk=CHUNK):
+    """
+    Yield (types, addresses) chunks for n accesses. `ratio` gives the share
+    of reads, writes and instruction fetches; data accesses come from
+    `pattern` and instruction fetches from `code` (a small sequential loop
+    by default). `seed` is an int or a numpy SeedSequence.
+    """
+    rng = np.random.default_rng(seed)
+    if code is None:
+        code = Sequential(base=0x00400000, size=1 << 12, stride=4)
+    ratio = np.asarray(ratio, dtype=float)
+    ratio = ratio / ratio.sum()
+
+    remaining = n
+    while remaining > 0:
+        size = min(chunk, remaining)
+        types = rng.choice(3, size, p=ratio).astype(np.uint8)
+
+        addresses = np.empty(size, dtype=np.uint32)
+        fetch = types == 2
+        fetches = int(fetch.sum())
+        if fetches:
+            addresses[fetch] = code.generate(rng, fetches)
+        if fetches < size:
+            addresses[~fetch] = pattern.generate(rng, size - fetches)
+
+        yield types, addresses
+        remaining -= size
+
+
+def format_din(types, addresses):
+    """
+    Render a chunk as Dinero text, "<type> <8 hex digits> 0" per line,
+    without a Python-level loop.
+    """
+    n = len(types)
+    lines = np.empty((n, 13), dtype=np.uint8)
+    lines[:, 0] = types + ord("0")
+    lines[:, 1] = ord(" ")
+    lines[:, 2:10] = HEX_DIGITS[(addresses[:, None] >> SHIFTS) & 0xF]
+    lines[:, 10] = ord(" ")
+    lines[:, 11] = ord("0")
+    lines[:, 12] = ord("\n")
+    return lines.tobytes()
+
+
+def write_trace(path, chunks):
+    """
+    Write generated chunks as Dinero text (.din) or packed binary records
+    (.dinb, see BINARY_RECORD). Returns the number of records written.
+    """
+    binary = path.endswith(".dinb")
+    assert binary or path.endswith(".din"), "File must be of type .din or .dinb"
+
+    count = 0
+    with open(path, "wb") as f:
+        for types, addresses in chunks:
+            if binary:
+                records = np.empty(len(types), dtype=BINARY_RECORD)
+                records["type"] = types
+                records["address"] = addresses
+                f.write(records.tobytes())
+            else:
+                f.write(format_din(types, addresses))
+            count += len(types)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic Dinero trace generator.")
+    parser.add_argument("output", help="output trace, .din (text) or .dinb (binary)")
+    parser.add_argument("--pattern", choices=["sequential", "strided", "chase", "zipf", "mix"], default="mix")
+    parser.add_argument("-n", "--accesses", type=int, default=1000000)
+    parser.add_argument("--ratio", default="0.6,0.2,0.2", help="read,write,ifetch shares")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # independent streams for the pattern's layout and for the accesses drawn from it
+    pattern_seed, access_seed = np.random.SeedSequence(args.seed).spawn(2)
+    pattern = make_pattern(args.pattern, np.random.default_rng(pattern_seed))
+    ratio = [float(share) for share in args.ratio.split(",")]
+
+    count = write_trace(args.output, generate(pattern, args.accesses, ratio, seed=access_seed))
+    print("Wrote {} accesses to {}".format(count, args.output))
+
+    if hasattr(pattern, "expected_hit_rate"):
+        print("Expected L1 data hit rate (direct-mapped, 64 B blocks, 32 KiB): {:.6f}".format(pattern.expected_hit_rate(64, 1 << 15)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+from itertools import islice
+
+from CacheSimulator import BINARY_RECORD, TRACE_DIR, parse_line, stream_trace
+
+# bump when the sidecar layout changes so stale indexes get rebuilt
+INDEX_VERSION = 1
+
+ACCESS_TYPES = {0: "read", 1: "write", 2: "ifetch", 3: "ignore", 4: "flush"}
+
+
+def index_path(filename):
+    return filename + ".idx"
+
+
+def build_index(filename, every=1 << 16, window=100000, block_size=64, page_size=4096):
+    """
+    Scan a trace once and write its summary sidecar next to it. Records
+    access counts per Dinero type, unique block and page counts, the number
+    of unique blocks touched in each window of `window` records, address
+    bounds, and the byte offset of every `every`-th record.
+    """
+    block_bits = block_size.bit_length() - 1
+    page_bits = page_size.bit_length() - 1
+
+    counts = [0] * len(ACCESS_TYPES)
+    blocks = set()
+    pages = set()
+    working_set = []
+    window_blocks = set()
+    bounds = {"data": [None, None], "instruction": [None, None]}
+    offsets = []
+
+    def bound(kind, address):
+        low, high = bounds[kind]
+        if low is None or address < low:
+            bounds[kind][0] = address
+        if high is None or address > high:
+            bounds[kind][1] = address
+
+    binary = filename.endswith(".dinb")
+    if binary:
+        records = stream_trace(filename)
+    else:
+        records = text_records(filename, every, offsets)
+
+    n = 0
+    for type_, address in records:
+        if binary and n % every == 0:
+            offsets.append(n * BINARY_RECORD.size)
+
+        counts[type_] += 1
+        if type_ <= 2:
+            block = address >> block_bits
+            blocks.add(block)
+            pages.add(address >> page_bits)
+            window_blocks.add(block)
+            bound("instruction" if type_ == 2 else "data", address)
+
+        n += 1
+        if n % window == 0:
+            working_set.append(len(window_blocks))
+            window_blocks = set()
+
+    if window_blocks:
+        working_set.append(len(window_blocks))
+
+    stat = os.stat(filename)
+    index = {
+        "version": INDEX_VERSION,
+        "trace": os.path.basename(filename),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "records": n,
+        "counts": {ACCESS_TYPES[i]: count for i, count in enumerate(counts)},
+        "block_size": block_size,
+        "unique_blocks": len(blocks),
+        "page_size": page_size,
+        "unique_pages": len(pages),
+        "window": window,
+        "working_set": working_set,
+        "address_bounds": bounds,
+        "every": every,
+        "offsets": offsets,
+    }
+
+    with open(index_path(filename), "w") as f:
+        json.dump(index, f)
+    return index
+
+
+def text_records(filename, every, offsets):
+    """
+    Parse a text trace while recording the byte offset of every `every`-th
+    line.
+    """
+    offset = 0
+    with open(filename, "rb") as f:
+        for n, line in enumerate(f):
+            if n % every == 0:
+                offsets.append(offset)
+            offset += len(line)
+            yield parse_line(line.decode())
+
+
+def load_index(filename):
+    """
+    Read a trace's sidecar. Returns None if there is none or the trace has
+    changed since it was built.
+    """
+    try:
+        with open(index_path(filename)) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    stat = os.stat(filename)
+    if index.get("version") != INDEX_VERSION or index["size"] != stat.st_size or index["mtime"] != stat.st_mtime:
+        return None
+    return index
+
+
+def ensure_index(filename, **kwargs):
+    """
+    Load a trace's sidecar, building it first if it is missing or stale.
+    """
+    index = load_index(filename)
+    if index is None:
+        index = build_index(filename, **kwargs)
+    return index
+
+
+def read_records(filename, start, count=None, index=None):
+    """
+    Yield (type, address) pairs for records [start, start + count) by
+    seeking to the nearest indexed offset instead of reading from the top.
+    """
+    if index is None:
+        index = ensure_index(filename)
+    if start >= index["records"]:
+        # also covers an empty trace, which has no offsets to seek to
+        return
+
+    checkpoint = min(start // index["every"], len(index["offsets"]) - 1)
+    skip = start - checkpoint * index["every"]
+    stop = None if count is None else skip + count
+
+    if filename.endswith(".dinb"):
+        with open(filename, "rb") as f:
+            f.seek(index["offsets"][checkpoint] + skip * BINARY_RECORD.size)
+            remaining = count
+            while remaining is None or remaining > 0:
+                size = 1 << 16 if remaining is None else min(1 << 16, remaining)
+                block = f.read(size * BINARY_RECORD.size)
+                if not block:
+                    return
+                for record in BINARY_RECORD.iter_unpack(block):
+                    yield record
+                if remaining is not None:
+                    remaining -= len(block) // BINARY_RECORD.size
+        return
+
+    with open(filename, "rb") as f:
+        f.seek(index["offsets"][checkpoint])
+        for line in islice(f, skip, stop):
+            yield parse_line(line.decode())
+
+
+def report(index):
+    """
+    Output the summary held in a sidecar.
+    """
+    print("Trace Summary for {}\n".format(index["trace"]))
+
+    print("Records:", index["records"])
+    for name, count in index["counts"].items():
+        print("  {}: {}".format(name, count))
+
+    print("Unique {}-byte Blocks: {}".format(index["block_size"], index["unique_blocks"]))
+    print("Unique {}-byte Pages: {}".format(index["page_size"], index["unique_pages"]))
+
+    working_set = index["working_set"]
+    if working_set:
+        print("Working Set per {} Records (blocks): min {}, mean {:.1f}, max {}".format(
+            index["window"], min(working_set), sum(working_set) / len(working_set), max(working_set)))
+
+    for kind, (low, high) in index["address_bounds"].items():
+        if low is not None:
+            print("{} Addresses: 0x{:08x} - 0x{:08x}".format(kind.capitalize(), low, high))
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or show trace summary sidecars.")
+    parser.add_argument("input_files", nargs="+", help="traces in ./Traces/Spec_Benchmark/")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild even if a current sidecar exists")
+    parser.add_argument("--every", type=int, default=1 << 16, help="record an offset every N records")
+    parser.add_argument("--window", type=int, default=100000, help="working-set window in records")
+    args = parser.parse_args()
+
+    for name in args.input_files:
+        filename = TRACE_DIR + name
+        index = None if args.rebuild else load_index(filename)
+        if index is None:
+            index = build_index(filename, every=args.every, window=args.window)
+        report(index)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+import argparse
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from itertools import islice
+
+from CacheSimulator import TRACE_DIR, CacheSim, L1Cache, default_config, load_config, stream_trace
+from FastSim import FastSim, warm_up
+
+# engines that can be validated; each is built as engine(filename, config=..., limit=...)
+# and run() returns its SimStats
+ENGINES = {
+    "reference": CacheSim,
+    "fast": FastSim,
+}
+
+# stats that only name the run
+IGNORED = {"Trace"}
+
+
+"""
+Synthetic edge cases. Each is generated from a fixed seed with a private
+random.Random, leaving alone the module-level random state that the
+simulators draw their replacement choices from.
+"""
+
+def write_din(path, records):
+    with open(path, "w") as f:
+        for type_, address in records:
+            f.write("{} {:x} 0\n".format(type_, address))
+
+
+def conflict_storm(rng, n, l2_sets=1024, block_size=64, blocks=32):
+    """
+    Reads cycling over more blocks than any set holds, all mapping to the
+    same L1 and L2 set, so nearly every access evicts.
+    """
+    stride = l2_sets * block_size
+    for _ in range(n):
+        yield rng.choice((0, 2)), 0x10000000 + rng.randrange(blocks) * stride
+
+
+def invalidation_chain(rng, n, l2_sets=1024, block_size=64, blocks=12):
+    """
+    Data reads, instruction fetches and writes to a few blocks sharing one
+    L2 set, so L2 evictions keep back-invalidating lines both L1s hold.
+    """
+    stride = l2_sets * block_size
+    for _ in range(n):
+        address = 0x20000000 + rng.randrange(blocks) * stride + rng.randrange(block_size // 4) * 4
+        yield rng.choice((0, 1, 2, 2)), address
+
+
+def write_stream(rng, n, footprint=1 << 21, block_size=64):
+    """
+    Mostly writes sweeping a region larger than the L2, with reads of what
+    was just written, so dirty lines are constantly written back to DRAM.
+    """
+    position = 0
+    for _ in range(n):
+        if rng.random() < 0.8:
+            yield 1, 0x30000000 + position
+            position = (position + 4) % footprint
+        else:
+            yield 0, 0x30000000 + rng.randrange(max(position, 1)) // block_size * block_size
+
+
+def random_mix(rng, n, footprint=1 << 20):
+    """
+    Uniformly random reads, writes and fetches over a region a few times
+    the L2 size.
+    """
+    for _ in range(n):
+        yield rng.choice((0, 0, 1, 2)), 0x40000000 + rng.randrange(footprint // 4) * 4
+
+
+SYNTHETIC = {
+    "conflict-storm": conflict_storm,
+    "invalidation-chain": invalidation_chain,
+    "write-stream": write_stream,
+    "random-mix": random_mix,
+}
+
+
+def run_engine(engine, filename, config, limit, seed):
+    """
+    Run an engine from a seed. Returns its stats as a flat row, the random
+    module's state afterwards, and the run time.
+    """
+    random.seed(seed)
+    start = time.perf_counter()
+    stats = engine(filename, config=config, limit=limit).run()
+    elapsed = time.perf_counter() - start
+    return stats.as_row(), random.getstate(), elapsed
+
+
+def compare(expected, actual, rel_tol=0.0, abs_tol=0.0):
+    """
+    Stats that differ beyond the tolerance, as (name, expected, actual).
+    Counters must always match exactly.
+    """
+    mismatches = []
+    for name, value in expected.items():
+        if name in IGNORED:
+            continue
+        other = actual.get(name)
+        if isinstance(value, int) and not isinstance(value, bool):
+            if value != other:
+                mismatches.append((name, value, other))
+        elif other is None or not math.isclose(value, other, rel_tol=rel_tol, abs_tol=abs_tol):
+            mismatches.append((name, value, other))
+    return mismatches
+
+
+def first_divergence(candidate, filename, config, limit, seed, rel_tol=0.0, abs_tol=0.0):
+    """
+    Binary-search for the shortest prefix whose stats differ between the
+    reference and the candidate. Returns the 0-based index of the access
+    that ends it, or None if the full run agrees.
+    """
+    def diverges(n):
+        expected, _, _ = run_engine(CacheSim, filename, config, n, seed)
+        actual, _, _ = run_engine(candidate, filename, config, n, seed)
+        return bool(compare(expected, actual, rel_tol, abs_tol))
+
+    high = limit if limit is not None else sum(1 for _ in stream_trace(filename))
+    if not diverges(high):
+        return None
+
+    low = 0    # the empty prefix always agrees
+    while high - low > 1:
+        middle = (low + high) // 2
+        if diverges(middle):
+            high = middle
+        else:
+            low = middle
+    return high - 1
+
+
+def validate(candidate, filename, config, limit=None, seed=0, rel_tol=0.0, abs_tol=0.0, random_state=True):
+    """
+    Run the reference and the candidate on one trace and configuration.
+    Returns a result dict with the mismatches, the first divergent access
+    (index and record) if any, and both run times.
+    """
+    expected, reference_state, reference_time = run_engine(CacheSim, filename, config, limit, seed)
+    actual, candidate_state, candidate_time = run_engine(candidate, filename, config, limit, seed)
+
+    mismatches = compare(expected, actual, rel_tol, abs_tol)
+    if random_state and candidate_state != reference_state:
+        mismatches.append(("random state", "", ""))
+
+    result = {
+        "mismatches": mismatches,
+        "reference_time": reference_time,
+        "candidate_time": candidate_time,
+        "divergence": None,
+    }
+
+    if any(name != "random state" for name, _, _ in mismatches):
+        index = first_divergence(candidate, filename, config, limit, seed, rel_tol, abs_tol)
+        if index is not None:
+            record = next(islice(stream_trace(filename), index, None))
+            result["divergence"] = (index, record)
+    return result
+
+
+def resident(cache):
+    """
+    Addresses of the blocks a cache holds, for an L1 or any lower level.
+    """
+    if isinstance(cache, L1Cache):
+        return [((tag << cache.set_bits) | set_index) << cache.block_bits
+                for set_index, tag in enumerate(cache.tags) if cache.valid[set_index]]
+    sets = list(cache.tags) if cache.sparse else range(cache.sets)
+    return [cache.block_number(set_index, way) << cache.block_bits
+            for set_index in sets for way in range(cache.associativity) if cache.valid[set_index][way]]
+
+
+def inclusion(filename, config, limit, seed):
+    """
+    Run the reference on a hierarchy with more than one level below L1 and
+    check that every level's blocks are still held by the level below it.
+    Returns (upper, lower, missing, held) for each pair that is not
+    inclusive.
+    """
+    random.seed(seed)
+    simulator = CacheSim(None, config=config)
+    for type_, address in stream_trace(filename, limit):
+        simulator.line_access(type_, address)
+
+    pairs = [("L1 Data", simulator.l1_data, simulator.l2), ("L1 Instruction", simulator.l1_instruction, simulator.l2)]
+    pairs += [(upper.name, upper, lower) for upper, lower in zip(simulator.levels, simulator.levels[1:])]
+    violations = []
+    for name, upper, lower in pairs:
+        blocks = resident(upper)
+        missing = sum(1 for address in blocks if not lower.holds(address))
+        if missing:
+            violations.append((name, lower.name, missing, len(blocks)))
+    return violations
+
+
+def configs(associativities, replacements):
+    """
+    L2 shapes to validate: every associativity (1 is direct-mapped, 4096
+    fully associative at the default size) under every replacement policy.
+    """
+    shapes = []
+    for associativity in associativities:
+        for replacement in replacements:
+            config = default_config(associativity)
+            config["levels"][0]["replacement"] = replacement
+            shapes.append(("{}-way {}".format(associativity, replacement), config))
+    return shapes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate a simulation engine against the reference CacheSim.")
+    parser.add_argument("input_files", nargs="*", help="traces in ./Traces/Spec_Benchmark/ to validate on")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="fast", help="candidate engine")
+    parser.add_argument("--prefixes", default="10000,100000", help="comma-separated trace prefixes; 0 means the whole trace")
+    parser.add_argument("--synthetic", type=int, default=50000, metavar="N", help="accesses per synthetic edge case (0 to skip)")
+    parser.add_argument("--l2-assoc", default="1,4,8,4096", help="comma-separated L2 associativities")
+    parser.add_argument("--replacement", default="random,lru", help="comma-separated L2 replacement policies")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rel-tol", type=float, default=0.0, help="relative tolerance on times and energies")
+    parser.add_argument("--abs-tol", type=float, default=0.0, help="absolute tolerance on times and energies")
+    parser.add_argument("--ignore-random-state", action="store_true", help="do not require the random module to end in the same state")
+    parser.add_argument("--inclusion", default="configs/l3.json", metavar="CONFIG",
+                        help="multi-level hierarchy whose inclusion the reference is checked on (empty to skip)")
+    args = parser.parse_args()
+
+    candidate = ENGINES[args.engine]
+    if candidate is FastSim:
+        warm_up()
+
+    shapes = configs([int(a) for a in args.l2_assoc.split(",")], args.replacement.split(","))
+    prefixes = [int(p) or None for p in args.prefixes.split(",")]
+    deep = load_config(args.inclusion) if args.inclusion else None
+
+    directory = tempfile.mkdtemp(prefix="validate-")
+    try:
+        cases = []
+        for name in args.input_files:
+            for prefix in prefixes:
+                cases.append(("{} ({})".format(name, "full" if prefix is None else "{} lines".format(prefix)), TRACE_DIR + name, prefix))
+        if args.synthetic:
+            rng = random.Random(args.seed)
+            for name, generate in SYNTHETIC.items():
+                path = os.path.join(directory, name + ".din")
+                write_din(path, generate(rng, args.synthetic))
+                cases.append((name, path, None))
+
+        failures = 0
+        reference_total = candidate_total = 0
+        print("Validating {} against the reference ({} cases x {} configurations)\n".format(args.engine, len(cases), len(shapes)))
+
+        for case, filename, limit in cases:
+            for shape, config in shapes:
+                result = validate(candidate, filename, config, limit, args.seed, args.rel_tol, args.abs_tol,
+                                  not args.ignore_random_state)
+                reference_total += result["reference_time"]
+                candidate_total += result["candidate_time"]
+                speedup = result["reference_time"] / result["candidate_time"] if result["candidate_time"] > 0 else float("inf")
+
+                status = "OK" if not result["mismatches"] else "FAILED"
+                print("{:<6} {:<28} {:<14} {:>7.1f}x".format(status, case, shape, speedup))
+                if result["mismatches"]:
+                    failures += 1
+                    for name, expected, actual in result["mismatches"]:
+                        print("         {}: reference {}, {} {}".format(name, expected, args.engine, actual))
+                    if result["divergence"] is not None:
+                        index, (type_, address) = result["divergence"]
+                        print("         first divergent access: #{} (type {}, address 0x{:08x})".format(index, type_, address))
+
+            if deep is not None:
+                violations = inclusion(filename, deep, limit, args.seed)
+                print("{:<6} {:<28} {}".format("OK" if not violations else "FAILED", case, "inclusion"))
+                if violations:
+                    failures += 1
+                    for upper, lower, missing, held in violations:
+                        print("         {} of {} {} blocks not held by {}".format(missing, held, upper, lower))
+
+        runs = len(cases) * (len(shapes) + (deep is not None))
+        print("\n{} of {} runs match".format(runs - failures, runs))
+        print("Reference: {:.3f} s  {}: {:.3f} s  Overall Speedup: {:.1f}x".format(
+            reference_total, args.engine, candidate_total, reference_total / candidate_total if candidate_total > 0 else float("inf")))
+    finally:
+        shutil.rmtree(directory)
+
+    # a non-zero exit status lets scripts and CI gate on the result
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
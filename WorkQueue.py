@@ -0,0 +1,230 @@
+import json
+import os
+import random
+import socket
+import sqlite3
+import time
+
+from FastSim import FastSim
+from Stats import SimStats
+from TraceIndex import load_index
+
+"""
+A work queue for sweeps spread over several processes or nodes. The queue
+is a directory holding an SQLite database of cells and a shards/ folder:
+
+  queue.db     one row per (trace, config, seed) cell, with its lease
+  shards/      one JSON-lines file of results per worker
+
+Workers claim cells with a lease inside an immediate transaction, so two
+workers never hold the same live lease; a cell whose lease has expired
+(its worker died or stalled) is handed out again. Results are appended to
+the worker's shard before the cell is marked done, so a result is never
+lost, and duplicates from a re-run cell are dropped when the coordinator
+merges the shards. Nodes need the queue directory and the traces on a
+shared filesystem with working file locks.
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cells (
+    id INTEGER PRIMARY KEY,
+    trace TEXT NOT NULL,
+    config TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    cost REAL NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+)
+"""
+
+# seconds a claimed cell stays leased before another worker may take it
+LEASE = 600
+
+# attempts before a cell that keeps raising is given up on
+MAX_ATTEMPTS = 3
+
+
+def connect(directory):
+    os.makedirs(os.path.join(directory, "shards"), exist_ok=True)
+    db = sqlite3.connect(os.path.join(directory, "queue.db"), timeout=60, isolation_level=None)
+    db.execute(SCHEMA)
+    return db
+
+
+def trace_cost(filename):
+    """
+    Relative cost of simulating a trace: its record count if it has been
+    indexed, otherwise its size. A trace missing here may still exist on
+    the workers' side, so it is queued last rather than rejected.
+    """
+    if not os.path.exists(filename):
+        return 0
+    index = load_index(filename)
+    return index["records"] if index is not None else os.path.getsize(filename)
+
+
+def submit(directory, cells):
+    """
+    Write the manifest: `cells` is a sequence of (trace, config, seed,
+    label) tuples, where `label` is a dict of the columns the cell reports
+    under. Replaces any previous sweep in the directory. Cells are handed
+    out longest trace first, so the slowest ones do not straggle at the
+    end.
+    """
+    db = connect(directory)
+    shards = os.path.join(directory, "shards")
+    for name in os.listdir(shards):
+        os.remove(os.path.join(shards, name))
+
+    costs = {}
+    rows = []
+    for trace, config, seed, label in cells:
+        if trace not in costs:
+            costs[trace] = trace_cost(trace)
+        rows.append((trace, json.dumps(config), seed, json.dumps(label), costs[trace]))
+
+    db.execute("BEGIN IMMEDIATE")
+    db.execute("DELETE FROM cells")
+    db.executemany("INSERT INTO cells (trace, config, seed, label, cost) VALUES (?, ?, ?, ?, ?)", rows)
+    db.execute("COMMIT")
+    db.close()
+    return len(rows)
+
+
+def claim(db, worker, lease=LEASE):
+    """
+    Lease the next pending or expired cell to `worker`. Returns the cell,
+    or None if there is nothing to claim right now.
+    """
+    now = time.time()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        row = db.execute(
+            "SELECT id, trace, config, seed FROM cells "
+            "WHERE state = 'pending' OR (state = 'leased' AND lease_until < ?) "
+            "ORDER BY cost DESC, id LIMIT 1", (now,)).fetchone()
+        if row is not None:
+            db.execute("UPDATE cells SET state = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                       (worker, now + lease, row[0]))
+        db.execute("COMMIT")
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+
+    if row is None:
+        return None
+    cell_id, trace, config, seed = row
+    return {"id": cell_id, "trace": trace, "config": json.loads(config), "seed": seed}
+
+
+def complete(db, cell):
+    db.execute("UPDATE cells SET state = 'done', lease_until = NULL WHERE id = ? AND state != 'done'", (cell["id"],))
+
+
+def fail(db, cell, worker, error, max_attempts=MAX_ATTEMPTS):
+    """
+    Release a cell whose simulation raised, or give up on it after
+    `max_attempts`.
+    """
+    db.execute("UPDATE cells SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+               "lease_until = NULL, error = ? WHERE id = ? AND worker = ?",
+               (max_attempts, error, cell["id"], worker))
+
+
+def remaining(db):
+    """
+    Number of cells not yet done or given up on.
+    """
+    return db.execute("SELECT COUNT(*) FROM cells WHERE state IN ('pending', 'leased')").fetchone()[0]
+
+
+def status(directory):
+    db = connect(directory)
+    counts = dict(db.execute("SELECT state, COUNT(*) FROM cells GROUP BY state").fetchall())
+    db.close()
+    return counts
+
+
+def simulate(cell):
+    """
+    Run one cell from its own seed.
+    """
+    random.seed(cell["seed"])
+    return FastSim(cell["trace"], config=cell["config"]).run()
+
+
+def work(directory, worker=None, lease=LEASE, poll=1.0):
+    """
+    Claim and run cells until none are left. Leases held by other workers
+    are waited on, since they may still expire. Returns the number of cells
+    this worker completed.
+    """
+    worker = worker or "{}-{}".format(socket.gethostname(), os.getpid())
+    db = connect(directory)
+    done = 0
+
+    with open(os.path.join(directory, "shards", worker + ".jsonl"), "a") as shard:
+        while True:
+            cell = claim(db, worker, lease)
+            if cell is None:
+                if remaining(db) == 0:
+                    break
+                time.sleep(poll)
+                continue
+
+            try:
+                stats = simulate(cell)
+            except Exception as e:
+                fail(db, cell, worker, repr(e))
+                continue
+
+            shard.write(json.dumps({"id": cell["id"], "worker": worker, "stats": stats.as_dict()}) + "\n")
+            shard.flush()
+            os.fsync(shard.fileno())
+
+            complete(db, cell)
+            done += 1
+
+    db.close()
+    return done
+
+
+def merge(directory):
+    """
+    Gather every shard and sum the stats of cells sharing a trace and label
+    (e.g. the seeds of one configuration). Returns (trace, label, stats)
+    groups in manifest order, and the ids of cells with no result.
+    """
+    results = {}
+    shards = os.path.join(directory, "shards")
+    for name in sorted(os.listdir(shards)):
+        with open(os.path.join(shards, name)) as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    # a worker died mid-write; its cell was re-run elsewhere
+                    continue
+                result = json.loads(line)
+                results.setdefault(result["id"], result["stats"])
+
+    db = connect(directory)
+    cells = db.execute("SELECT id, trace, label FROM cells ORDER BY id").fetchall()
+    db.close()
+
+    groups = {}
+    missing = []
+    for cell_id, trace, label in cells:
+        if cell_id not in results:
+            missing.append(cell_id)
+            continue
+        stats = SimStats.from_dict(results[cell_id])
+        key = (trace, label)
+        if key in groups:
+            groups[key].add(stats)
+        else:
+            groups[key] = stats
+
+    return [(trace, json.loads(label), stats) for (trace, label), stats in groups.items()], missing